@@ -3,33 +3,75 @@ import datetime
 
 from cluster.cluster_node import DbClusterNode
 from cluster.cluster_node_role import DbRole
+from cluster import master_ranking
+from cluster.cluster_diff import DbClusterDiff
+from utils import journal
 
 
 class DbCluster:
     """Contains information about cluster nodes."""
 
-    def __init__(self, connection_strings_to_cluster_nodes):
+    def __init__(self, connection_strings_to_cluster_nodes, nodes_priority=None, probe_registry=None):
         self.nodes = {}
         self.connected_master_nodes_names = []
         self.connected_standby_nodes_names = []
         self.no_masterdb_in_cluster_event_start_time = None
         self.several_masterdb_in_cluster_event_start_time = None
+        self.ranked_master_nodes = None
+        self.nodes_snapshot = {}
+        self.diff = None
+        self.subscribers = []
+        self.node_subscribers = []
 
         self.logger = logging.getLogger("logger")
 
         for node_host_name, connection_string in connection_strings_to_cluster_nodes:
-            self.nodes[node_host_name] = DbClusterNode(node_host_name, connection_string)
+            self.nodes[node_host_name] = DbClusterNode(node_host_name, connection_string, probe_registry)
 
-        self.update()
+        # by default the priority of nodes is defined by their order in the config
+        self.nodes_priority = list(nodes_priority) if nodes_priority else list(self.nodes.keys())
+
+    @staticmethod
+    def write_node_events(node, was_connected, previous_db_role):
+        """Writes to the events journal changes of the node connection and role."""
+        if node.connected != was_connected:
+            journal.write_event("node_connected" if node.connected else "node_disconnected", node=node.host_name)
+
+        if node.connected and node.state.db_role != previous_db_role:
+            journal.write_event("role_changed", node=node.host_name, old=str(previous_db_role), new=str(node.state.db_role))
+
+    def subscribe(self, callback):
+        """Registers callback(cluster, diff) which is called after each update with the changes of the cluster state."""
+        self.subscribers.append(callback)
+
+    def subscribe_node_updated(self, callback):
+        """Registers callback(cluster, node) which is called right after each node is updated, before the scan of the other nodes."""
+        self.node_subscribers.append(callback)
+
+    def notify_node_updated(self, node):
+        for callback in self.node_subscribers:
+            try:
+                callback(self, node)
+            except Exception as ex:
+                self.logger.exception(f"Subscriber {callback} has failed to handle the update of node {node.host_name}: {ex}")
 
     def update(self):
         """Retrieves information about cluster nodes."""
+        previous_masters = self.connected_master_nodes_names
+        previous_standbys = self.connected_standby_nodes_names
         self.connected_master_nodes_names = []
         self.connected_standby_nodes_names = []
+        self.ranked_master_nodes = None
 
         for node, attrs in self.nodes.items():
+            was_connected = attrs.connected
+            previous_db_role = attrs.state.db_role
             self.nodes[node].update()
-            self.logger.debug(f"Update information for node {node}: {attrs}")
+            self.notify_node_updated(attrs)
+            # node is converted to string only if debug level is enabled
+            self.logger.debug("Update information for node %s: %s", node, attrs)
+
+            self.write_node_events(attrs, was_connected, previous_db_role)
 
             if self.nodes[node].connected:
                 if self.nodes[node].state.db_role == DbRole.MASTER:
@@ -38,21 +80,59 @@ class DbCluster:
                 if self.nodes[node].state.db_role == DbRole.STANDBY:
                     self.connected_standby_nodes_names.append(node)
 
+        self.update_masters_count_events()
+
+        if len(self.connected_standby_nodes_names) == 0:
+            self.logger.warning("Detected no standby DB nodes in the cluster.")
+
+        self.update_diff(previous_masters, previous_standbys)
+
+    def update_masters_count_events(self):
+        """Tracks the start time of the periods with several masters or no master in the cluster
+        and writes changes of the number of masters to the events journal."""
         if len(self.connected_master_nodes_names) > 1:
             if self.several_masterdb_in_cluster_event_start_time is None:
                 self.several_masterdb_in_cluster_event_start_time = datetime.datetime.now()
+                journal.write_event("split_brain_detected", masters=self.connected_master_nodes_names)
             self.no_masterdb_in_cluster_event_start_time = None
             self.logger.warning(f"Detected {len(self.connected_master_nodes_names)} master DB nodes.")
 
         if len(self.connected_master_nodes_names) == 1:
+            if self.no_masterdb_in_cluster_event_start_time is not None or self.several_masterdb_in_cluster_event_start_time is not None:
+                journal.write_event("single_master_restored", master=self.connected_master_nodes_names[0])
             self.no_masterdb_in_cluster_event_start_time = None
             self.several_masterdb_in_cluster_event_start_time = None
 
         if len(self.connected_master_nodes_names) == 0:
             if self.no_masterdb_in_cluster_event_start_time is None:
                 self.no_masterdb_in_cluster_event_start_time = datetime.datetime.now()
+                journal.write_event("master_lost")
             self.several_masterdb_in_cluster_event_start_time = None
             self.logger.warning("Detected no master DB node in the cluster.")
 
-        if len(self.connected_standby_nodes_names) == 0:
-            self.logger.warning("Detected no standby DB nodes in the cluster.")
+    def update_diff(self, previous_masters, previous_standbys):
+        """Compares the cluster state with the previous one and notifies subscribers."""
+        previous_nodes_snapshot = self.nodes_snapshot
+        self.nodes_snapshot = {name: DbClusterDiff.take_node_snapshot(node) for name, node in self.nodes.items()}
+        self.diff = DbClusterDiff.compare(previous_nodes_snapshot, self.nodes_snapshot,
+                                          previous_masters, self.connected_master_nodes_names,
+                                          previous_standbys, self.connected_standby_nodes_names)
+        if not self.diff.is_empty():
+            self.logger.debug("Cluster state has changed: %s", self.diff)
+
+        # subscribers are isolated from each other, otherwise a failed one would hide the diff from the next ones for good
+        for callback in self.subscribers:
+            try:
+                callback(self, self.diff)
+            except Exception as ex:
+                self.logger.exception(f"Subscriber {callback} has failed to handle the change of the cluster state: {ex}")
+
+    def get_ranked_master_nodes(self):
+        """Returns connected master DB nodes ordered by their rank, the result is cached until the next update."""
+        if self.ranked_master_nodes is None:
+            self.ranked_master_nodes = master_ranking.rank_master_nodes(self.nodes, self.nodes_priority)
+        return self.ranked_master_nodes
+
+    def get_probes_stats(self):
+        """Returns the cost of probes executed on each node."""
+        return {node_host_name: node.get_probes_stats() for node_host_name, node in self.nodes.items()}
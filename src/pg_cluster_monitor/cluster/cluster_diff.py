@@ -0,0 +1,51 @@
+class DbClusterDiff:
+    """Contains changes of the cluster state between two scans - connection, role and config changes of nodes
+    and changes of the sets of connected master and standby nodes."""
+
+    TRACKED_NODE_STATE_ATTRIBUTES = ("db_role", "synchronous_standby_names", "primary_conn_info", "primary_slot_name")
+
+    def __init__(self):
+        self.changed_node_attributes = {}
+        self.masters_changed = False
+        self.standbys_changed = False
+
+    def __str__(self):
+        return f"changedNodeAttributes={self.changed_node_attributes} mastersChanged={self.masters_changed} " \
+               f"standbysChanged={self.standbys_changed}"
+
+    def __repr__(self):
+        return self.__str__()
+
+    @staticmethod
+    def take_node_snapshot(node):
+        """Returns values of node attributes which are tracked between scans."""
+        snapshot = {"connected": node.connected}
+        for attribute in DbClusterDiff.TRACKED_NODE_STATE_ATTRIBUTES:
+            snapshot[attribute] = getattr(node.state, attribute)
+        return snapshot
+
+    @staticmethod
+    def compare(previous_nodes_snapshot, nodes_snapshot, previous_masters, masters, previous_standbys, standbys):
+        """Builds the diff between two snapshots of the cluster. A node which is absent in the previous snapshot is
+        considered as changed in all attributes."""
+        diff = DbClusterDiff()
+        for node_name, snapshot in nodes_snapshot.items():
+            previous_snapshot = previous_nodes_snapshot.get(node_name, {})
+            changed_attributes = {attribute for attribute, value in snapshot.items()
+                                  if attribute not in previous_snapshot or previous_snapshot[attribute] != value}
+            if changed_attributes:
+                diff.changed_node_attributes[node_name] = changed_attributes
+
+        diff.masters_changed = sorted(previous_masters) != sorted(masters)
+        diff.standbys_changed = sorted(previous_standbys) != sorted(standbys)
+        return diff
+
+    def is_empty(self):
+        return not self.changed_node_attributes and not self.masters_changed and not self.standbys_changed
+
+    def is_node_changed(self, node_name, *attributes):
+        """Returns True if any of the given attributes of the node has changed, or any attribute if none is given."""
+        changed_attributes = self.changed_node_attributes.get(node_name, set())
+        if not attributes:
+            return len(changed_attributes) > 0
+        return any(attribute in changed_attributes for attribute in attributes)
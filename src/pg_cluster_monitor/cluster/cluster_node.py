@@ -1,13 +1,15 @@
 import logging
 import datetime
+import time
 
 from cluster.cluster_node_state import DbClusterNodeState
 from cluster.cluster_node_role import DbRole
+from cluster.probes import ProbeRegistry, ProbeStats, get_builtin_probes
 from utils import db
 
 
 class DbClusterNode:
-    def __init__(self, host_name, connection_string):
+    def __init__(self, host_name, connection_string, probe_registry=None):
         self.logger = logging.getLogger("logger")
 
         self.host_name = host_name
@@ -16,6 +18,9 @@ class DbClusterNode:
         self.last_successful_connection_time = None
 
         self.state = DbClusterNodeState()
+        self.probe_registry = probe_registry if probe_registry is not None else ProbeRegistry(get_builtin_probes())
+        self.probes_stats = {}
+        self.duplicate_application_names = set()
 
     @staticmethod
     def replication_position_to_number(replication_position):
@@ -35,53 +40,143 @@ class DbClusterNode:
     def __repr__(self):
         return self.__str__()
 
-    def update(self):
-        """Retrieves PostgreSQL attributes from the DB."""
-
-        # connected
-        test, err = db.try_fetch_one(self.connection_string, "SELECT 42")
-        if err:
-            self.logger.warning(f"Cannot connect to {self.host_name}")
-            self.connected = False
+    def apply_db_role(self, rows):
+        if rows is None:
             return
-        self.connected = True
-        self.last_successful_connection_time = datetime.datetime.now()
-
-        # dbRole
-        is_in_recovery, err = db.try_fetch_one(self.connection_string, "SELECT pg_is_in_recovery()")
-        if is_in_recovery:
-            self.state.db_role = DbRole.STANDBY
+        self.state.db_role = DbRole.STANDBY if rows and rows[0][0] else DbRole.MASTER
+        if self.state.db_role != DbRole.MASTER:
+            self.state.replication_standbys = {}
+
+    def apply_wal_position(self, rows):
+        """Applies timeline, current WAL position and time of the last transaction retrieved in a single query."""
+        if not rows:
+            self.state.timeline_id, self.state.current_lsn, self.state.last_transaction_time = None, None, None
         else:
-            self.state.db_role = DbRole.MASTER
-
-        # dbTime
-        self.state.db_time, err = db.try_fetch_one(self.connection_string, "select to_char(now(), 'YYYY.MM.DD HH:MI:SS')")
+            self.state.timeline_id, self.state.current_lsn, self.state.last_transaction_time = rows[0]
+        self.state.current_lsn_as_number = self.replication_position_to_number(self.state.current_lsn)
 
-        # dbSize
-        db_size, err = db.try_fetch_one(self.connection_string, "SELECT SUM(pg_database_size(pg_database.datname)) FROM pg_database")
+    def apply_db_size(self, rows):
+        db_size = rows[0][0] if rows else None
         self.state.db_size_in_bytes = int(db_size) if db_size is not None else db_size
 
-        # replicationPosition
-        self.state.replication_position, err = db.try_fetch_one(self.connection_string, "SELECT pg_last_wal_receive_lsn()")
+    def apply_replication_position(self, rows):
+        self.state.replication_position = rows[0][0] if rows else None
         self.state.replication_position_as_number = self.replication_position_to_number(self.state.replication_position)
 
-        # synchronousStandbyNames
-        self.state.synchronous_standby_names, err = db.try_fetch_one(self.connection_string, "SHOW synchronous_standby_names")
-
-        # pgWalSize
-        self.state.pg_wal_size, err = db.try_fetch_one(self.connection_string, "SELECT pg_size_pretty(sum((pg_stat_file("
-                                                                       "concat('pg_wal/',fname))).size)) as "
-                                                                       "total_size from pg_ls_dir('pg_wal') as t("
-                                                                       "fname)")
+    def apply_replication_slots(self, rows):
+        """Applies replication slots with the amount of WAL retained by each slot and its growth rate since the previous scan."""
+        if rows is None:
+            self.state.replication_slots = {}
+            self.state.number_of_slots = 0
+            return
 
-        # pgWalFilesCount
-        self.state.pg_wal_files_count, err = db.try_fetch_one(self.connection_string, "SELECT count(*) FROM pg_ls_waldir()")
+        now = datetime.datetime.now()
+        previous_slots = self.state.replication_slots
+        slots = {}
+        for slot_name, active, restart_lsn, retained_bytes in rows:
+            retained_bytes = int(retained_bytes) if retained_bytes is not None else None
+            growth_bytes_per_sec = None
+            previous_slot = previous_slots.get(slot_name)
+            if previous_slot is not None and retained_bytes is not None and previous_slot["retained_bytes"] is not None:
+                time_delta_sec = (now - previous_slot["time"]).total_seconds()
+                if time_delta_sec > 0:
+                    growth_bytes_per_sec = int((retained_bytes - previous_slot["retained_bytes"]) / time_delta_sec)
+
+            slots[slot_name] = {"active": active, "restart_lsn": restart_lsn, "retained_bytes": retained_bytes,
+                                "growth_bytes_per_sec": growth_bytes_per_sec, "time": now}
+
+        self.state.replication_slots = slots
+        self.state.number_of_slots = len(slots)
+
+    def apply_replication_standbys(self, rows):
+        """Applies standbys which replicate from the master DB with their flush lag in bytes.
+        If several standbys have the same application_name the worst of them is kept. None means the standbys are unknown."""
+        if rows is None:
+            self.state.replication_standbys = None
+            return
 
-        # primaryConnInfo
-        self.state.primary_conn_info, err = db.try_fetch_one(self.connection_string, "SHOW primary_conninfo")
+        def badness(standby):
+            return standby["state"] != "streaming", standby["flush_lag_bytes"] is None, standby["flush_lag_bytes"] or 0
+
+        standbys, duplicate_application_names = {}, set()
+        for application_name, state, flush_lag_bytes in rows:
+            standby = {"state": state, "flush_lag_bytes": int(flush_lag_bytes) if flush_lag_bytes is not None else None}
+            if application_name in standbys:
+                duplicate_application_names.add(application_name)
+            if application_name not in standbys or badness(standby) > badness(standbys[application_name]):
+                standbys[application_name] = standby
+
+        # synchronous_standby_names refers to standbys by application_name, so standbys with the same name are
+        # indistinguishable, e.g. when primary_conninfo has no application_name and cluster_name is not set
+        if duplicate_application_names - self.duplicate_application_names:
+            self.logger.warning(f"Several standbys of {self.host_name} have the same application_name "
+                                f"{sorted(duplicate_application_names)}, set unique cluster_name on each standby.")
+        self.duplicate_application_names = duplicate_application_names
+        self.state.replication_standbys = standbys
+
+    def get_probes_stats(self):
+        """Returns the cost of probes executed on the node."""
+        return {name: stats.as_dict() for name, stats in list(self.probes_stats.items())}
+
+    def run_probe(self, conn, probe):
+        """Executes the probe, applies its result to the node state and accounts its cost.
+        Returns False if the probe has failed."""
+        stats = self.probes_stats.setdefault(probe.name, ProbeStats())
+        started = time.monotonic()
+        try:
+            rows = db.fetch_all_with_timeout(conn, probe.sql, probe.timeout_ms)
+        except Exception as ex:
+            self.logger.error(f"Cannot execute probe {probe.name} on {self.host_name}: {ex}")
+            rows = None
+        stats.add_run(started, (time.monotonic() - started) * 1000, rows)
+        self.update_probe_throttling(probe, stats)
+
+        # the result of a failed probe is unknown, so the previous value is not used by handlers as if it were current
+        if probe.handler:
+            getattr(self, probe.handler)(rows)
+        elif probe.attribute:
+            setattr(self.state, probe.attribute, rows[0][0] if rows else None)
+        elif rows is None:
+            self.state.probe_results.pop(probe.name, None)
+        else:
+            self.state.probe_results[probe.name] = [list(row) for row in rows]
+        return rows is not None
+
+    def update_probe_throttling(self, probe, stats):
+        """Stretches the interval of the probe if it is too expensive for the node, see `ProbeRegistry`."""
+        throttled_interval_sec = self.probe_registry.get_throttled_interval_sec(probe, stats)
+        if throttled_interval_sec is not None and stats.throttled_interval_sec is None:
+            self.logger.warning(f"Probe {probe.name} on {self.host_name} is throttled to once per {throttled_interval_sec} sec, "
+                                f"average duration = {round(stats.avg_duration_ms, 3)} ms.")
+        elif throttled_interval_sec is None and stats.throttled_interval_sec is not None:
+            self.logger.info(f"Probe {probe.name} on {self.host_name} is not throttled anymore, "
+                             f"average duration = {round(stats.avg_duration_ms, 3)} ms.")
+        stats.throttled_interval_sec = throttled_interval_sec
 
-        # primarySlotName
-        self.state.primary_slot_name, err = db.try_fetch_one(self.connection_string, "SHOW primary_slot_name")
+    def update(self):
+        """Retrieves PostgreSQL attributes from the DB executing due probes one by one on a single connection."""
+        try:
+            conn = db.connect(self.connection_string)
+        except Exception as ex:
+            self.logger.warning(f"Cannot connect to {self.host_name}: {ex}")
+            self.connected = False
+            return
 
-        # numberOfSlots
-        self.state.number_of_slots, err = db.try_fetch_one(self.connection_string, "SELECT count(*) from pg_replication_slots")
+        try:
+            # a failed probe must not abort the transaction of the following ones
+            conn.autocommit = True
+            now = time.monotonic()
+            for probe in self.probe_registry.probes:
+                if not probe.is_applicable(self.state.db_role):
+                    self.state.probe_results.pop(probe.name, None)
+                    continue
+                if not self.probe_registry.is_due(probe, self.probes_stats.get(probe.name, ProbeStats()), now):
+                    continue
+                if not self.run_probe(conn, probe) and probe.essential:
+                    self.connected = False
+                    return
+
+            self.connected = True
+            self.last_successful_connection_time = datetime.datetime.now()
+        finally:
+            conn.close()
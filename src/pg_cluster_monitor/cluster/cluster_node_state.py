@@ -11,6 +11,13 @@ class DbClusterNodeState:
         self.replication_position = None
         self.replication_position_as_number = 0
         self.number_of_slots = 0
+        self.replication_slots = {}
+        self.replication_standbys = {}
         self.primary_slot_name = ''
         self.db_time = None
         self.primary_conn_info = ''
+        self.timeline_id = None
+        self.current_lsn = None
+        self.current_lsn_as_number = 0
+        self.last_transaction_time = None
+        self.probe_results = {}
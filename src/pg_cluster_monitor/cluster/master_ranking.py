@@ -0,0 +1,21 @@
+from cluster.cluster_node_role import DbRole
+
+
+def get_master_node_rank(node, nodes_priority):
+    """Returns a sortable rank of the master DB node, the greater the rank the more the node deserves to stay master.
+    Nodes are compared by timeline, then by current WAL position, then by the time of the last transaction.
+    Ties are broken by the configured priority of nodes and finally by the host name, so every monitor
+    in the cluster comes to the same decision."""
+    timeline_id = node.state.timeline_id if node.state.timeline_id is not None else -1
+    last_transaction_timestamp = node.state.last_transaction_time.timestamp() \
+        if node.state.last_transaction_time is not None else 0
+    priority = nodes_priority.index(node.host_name) if node.host_name in nodes_priority else len(nodes_priority)
+
+    # negative priority because the first node of the list has the highest priority
+    return timeline_id, node.state.current_lsn_as_number, last_transaction_timestamp, -priority, node.host_name
+
+
+def rank_master_nodes(nodes, nodes_priority):
+    """Returns connected master DB nodes ordered from the most to the least suitable one to stay master."""
+    masters = [node for node in nodes.values() if node.connected and node.state.db_role == DbRole.MASTER]
+    return sorted(masters, key=lambda node: get_master_node_rank(node, nodes_priority), reverse=True)
@@ -0,0 +1,220 @@
+import datetime
+from cluster.cluster_node_role import DbRole
+
+PROBE_SECTION_PREFIX = "probe."
+DEFAULT_TIMEOUT_MS = 5000
+DEFAULT_MAX_DURATION_PERCENT = 1
+AVG_DURATION_WEIGHT = 0.2
+# a throttled probe is released when its stretched interval falls below this share of the base interval
+UNTHROTTLE_RATIO = 0.8
+DB_SIZE_INTERVAL_SEC = 300
+ROLES = {"master": DbRole.MASTER, "standby": DbRole.STANDBY}
+# the role probe must run on every scan of every node, the state of the node is unknown without it
+FIXED_PROBE_SETTINGS = {"db_role": ("roles", "interval_sec")}
+
+
+class Probe:
+    """SQL query which gathers attributes of a DB node.
+
+    roles        - roles of the node the probe is executed for, any role if empty;
+    interval_sec - minimal period between executions, 0 means the probe is executed on every scan;
+    timeout_ms   - statement_timeout of the query;
+    handler      - name of the DbClusterNode method which applies rows of the result to the node state;
+    attribute    - name of the node state attribute which gets the first value of the result;
+    essential    - the node is considered disconnected if the probe fails;
+    throttleable - the interval of the probe may be stretched if it is expensive. Only probes whose results are
+                   used for the status output may be throttled, not the ones failover and replication decisions rely on.
+    Rows of a probe without a handler and an attribute are stored in `probe_results` of the node state."""
+
+    def __init__(self, name, sql, roles=(), interval_sec=0, timeout_ms=DEFAULT_TIMEOUT_MS, handler=None, attribute=None,
+                 essential=False, throttleable=False):
+        self.name = name
+        self.sql = sql
+        self.roles = frozenset(roles)
+        self.interval_sec = interval_sec
+        self.timeout_ms = timeout_ms
+        self.handler = handler
+        self.attribute = attribute
+        self.essential = essential
+        self.throttleable = throttleable
+
+    def __str__(self):
+        return f"name={self.name} roles={sorted(str(role) for role in self.roles)} intervalSec={self.interval_sec} " \
+               f"timeoutMs={self.timeout_ms}"
+
+    def __repr__(self):
+        return self.__str__()
+
+    def is_applicable(self, db_role):
+        return not self.roles or db_role in self.roles
+
+
+class ProbeStats:
+    """Cost of a probe on a node - duration of executions and size of results."""
+
+    def __init__(self):
+        self.runs_count = 0
+        self.errors_count = 0
+        self.last_run_time = None
+        self.last_run_monotonic = None
+        self.last_duration_ms = None
+        self.avg_duration_ms = None
+        self.max_duration_ms = None
+        self.total_duration_ms = 0.0
+        self.last_rows_count = None
+        self.last_result_bytes = None
+        self.throttled_interval_sec = None
+
+    def add_run(self, started_monotonic, duration_ms, rows):
+        """Accounts an execution of the probe, `rows` is None if the probe has failed."""
+        self.runs_count += 1
+        self.last_run_time = datetime.datetime.now()
+        self.last_run_monotonic = started_monotonic
+        self.last_duration_ms = duration_ms
+        self.total_duration_ms += duration_ms
+        self.max_duration_ms = max(self.max_duration_ms or 0, duration_ms)
+        if self.avg_duration_ms is None:
+            self.avg_duration_ms = duration_ms
+        else:
+            self.avg_duration_ms += AVG_DURATION_WEIGHT * (duration_ms - self.avg_duration_ms)
+
+        if rows is None:
+            self.errors_count += 1
+            return
+
+        self.last_rows_count = len(rows)
+        self.last_result_bytes = sum(len(str(value)) for row in rows for value in row)
+
+    def as_dict(self):
+        return {"runs_count": self.runs_count, "errors_count": self.errors_count,
+                "last_run_time": str(self.last_run_time) if self.last_run_time else None,
+                "last_duration_ms": round(self.last_duration_ms, 3) if self.last_duration_ms is not None else None,
+                "avg_duration_ms": round(self.avg_duration_ms, 3) if self.avg_duration_ms is not None else None,
+                "max_duration_ms": round(self.max_duration_ms, 3) if self.max_duration_ms is not None else None,
+                "total_duration_ms": round(self.total_duration_ms, 3),
+                "last_rows_count": self.last_rows_count, "last_result_bytes": self.last_result_bytes,
+                "throttled_interval_sec": self.throttled_interval_sec}
+
+
+class ProbeRegistry:
+    """Probes which are executed on each node of the cluster, in the order of registration.
+    An expensive throttleable probe is throttled: its interval is stretched so its average duration on the node does not exceed
+    `max_duration_percent` of the interval. A probe is throttled only if the stretched interval is longer than the
+    interval the probe is actually executed with - its own interval, but not less than `scan_period_sec`.
+    Zero value of `max_duration_percent` disables throttling, it is also disabled for probes executed on every scan
+    if the scan period is unknown."""
+
+    def __init__(self, probes, max_duration_percent=DEFAULT_MAX_DURATION_PERCENT, scan_period_sec=0):
+        self.probes = list(probes)
+        self.max_duration_percent = max_duration_percent
+        self.scan_period_sec = scan_period_sec
+
+    def get_throttled_interval_sec(self, probe, stats):
+        """Returns the interval the probe should be executed with on the node if it is throttled, otherwise None."""
+        if not probe.throttleable or self.max_duration_percent <= 0 or stats.avg_duration_ms is None:
+            return None
+
+        base_interval_sec = max(probe.interval_sec, self.scan_period_sec)
+        if base_interval_sec <= 0:
+            return None
+        interval_sec = stats.avg_duration_ms / 1000 * 100 / self.max_duration_percent
+        # a throttled probe is released with a margin, so the average crossing the limit back and forth does not flap
+        threshold_sec = base_interval_sec * UNTHROTTLE_RATIO if stats.throttled_interval_sec is not None else base_interval_sec
+        if interval_sec <= threshold_sec:
+            return None
+        return round(max(interval_sec, base_interval_sec), 1)
+
+    @staticmethod
+    def is_due(probe, stats, now_monotonic):
+        """Returns True if the probe should be executed on the node on this scan."""
+        if stats.last_run_monotonic is None:
+            return True
+
+        interval_sec = stats.throttled_interval_sec or probe.interval_sec
+        return now_monotonic - stats.last_run_monotonic >= interval_sec
+
+
+def get_builtin_probes():
+    """Returns probes which fill DbClusterNodeState. The role probe goes first because the applicability
+    of the other probes depends on the role."""
+    return [
+        Probe("db_role", "SELECT pg_is_in_recovery()", handler="apply_db_role", essential=True),
+        # timelineId, currentLsn, lastTransactionTime - attributes to choose the master DB in case of several masters
+        # the timeline of the last checkpoint lags behind after promotion, so a master takes its current timeline
+        # from the name of the current WAL file, its first 8 hex digits
+        Probe("wal_position", "SELECT CASE WHEN pg_is_in_recovery() THEN (SELECT timeline_id FROM pg_control_checkpoint()) "
+                              "ELSE ('x' || substr(pg_walfile_name(pg_current_wal_lsn()), 1, 8))::bit(32)::int END, "
+                              "CASE WHEN pg_is_in_recovery() THEN pg_last_wal_replay_lsn() ELSE pg_current_wal_lsn() END, "
+                              "CASE WHEN pg_is_in_recovery() THEN pg_last_xact_replay_timestamp() "
+                              "WHEN current_setting('track_commit_timestamp') = 'on' THEN (pg_last_committed_xact()).timestamp END",
+              handler="apply_wal_position"),
+        Probe("db_time", "SELECT to_char(now(), 'YYYY.MM.DD HH:MI:SS')", attribute="db_time", throttleable=True),
+        # the size is used for the status output only, while it takes a stat() of every file of every database
+        Probe("db_size", "SELECT SUM(pg_database_size(pg_database.datname)) FROM pg_database", interval_sec=DB_SIZE_INTERVAL_SEC,
+              handler="apply_db_size", throttleable=True),
+        Probe("replication_position", "SELECT pg_last_wal_receive_lsn()", handler="apply_replication_position"),
+        Probe("synchronous_standby_names", "SHOW synchronous_standby_names", attribute="synchronous_standby_names"),
+        Probe("pg_wal_size", "SELECT pg_size_pretty(sum((pg_stat_file(concat('pg_wal/',fname))).size)) as total_size "
+                             "from pg_ls_dir('pg_wal') as t(fname)", attribute="pg_wal_size",
+              throttleable=True),
+        Probe("pg_wal_files_count", "SELECT count(*) FROM pg_ls_waldir()", attribute="pg_wal_files_count", throttleable=True),
+        Probe("primary_conn_info", "SHOW primary_conninfo", attribute="primary_conn_info"),
+        Probe("primary_slot_name", "SHOW primary_slot_name", attribute="primary_slot_name"),
+        Probe("replication_slots", "SELECT slot_name, active, restart_lsn, "
+                                   "pg_wal_lsn_diff(CASE WHEN pg_is_in_recovery() THEN pg_last_wal_replay_lsn() "
+                                   "ELSE pg_current_wal_lsn() END, restart_lsn) FROM pg_replication_slots",
+              handler="apply_replication_slots"),
+        Probe("replication_standbys", "SELECT application_name, state, pg_wal_lsn_diff(pg_current_wal_lsn(), flush_lsn) "
+                                      "FROM pg_stat_replication", roles=[DbRole.MASTER], handler="apply_replication_standbys"),
+    ]
+
+
+def parse_roles(value):
+    """Parses comma separated roles, e.g. `master, standby`. Empty value means any role."""
+    roles = []
+    for name in value.split(","):
+        name = name.strip().lower()
+        if not name:
+            continue
+        if name not in ROLES:
+            raise ValueError(f"Unknown role '{name}', expected one of {tuple(ROLES.keys())}.")
+        roles.append(ROLES[name])
+    return roles
+
+
+def read_config_probes(config, probes):
+    """Adds probes defined by `[probe.<name>]` sections of the config to the list, they may be throttled.
+    A section with the name of a built-in probe overrides its settings, except FIXED_PROBE_SETTINGS."""
+    probes_by_name = {probe.name: probe for probe in probes}
+    for section_name in config.sections():
+        if not section_name.startswith(PROBE_SECTION_PREFIX):
+            continue
+
+        section = config[section_name]
+        name = section_name[len(PROBE_SECTION_PREFIX):]
+        probe = probes_by_name.get(name)
+        if probe is None:
+            if not section.get("sql", "").strip():
+                raise ValueError(f"Setting `sql` is absent in section [{section_name}].")
+            probe = Probe(name, section["sql"], throttleable=True)
+            probes.append(probe)
+            probes_by_name[name] = probe
+        elif "sql" in section:
+            probe.sql = section["sql"]
+
+        for key in FIXED_PROBE_SETTINGS.get(name, ()):
+            if key in section:
+                raise ValueError(f"Setting `{key}` of section [{section_name}] cannot be overridden.")
+
+        if "roles" in section:
+            probe.roles = frozenset(parse_roles(section["roles"]))
+        probe.interval_sec = section.getint("interval_sec", probe.interval_sec)
+        probe.timeout_ms = section.getint("timeout_ms", probe.timeout_ms)
+    return probes
+
+
+def create_probe_registry(config):
+    """Returns the registry of built-in probes and probes defined in the config."""
+    probes = read_config_probes(config, get_builtin_probes())
+    max_duration_percent = config["main"].getint("probe_max_duration_percent", DEFAULT_MAX_DURATION_PERCENT)
+    return ProbeRegistry(probes, max_duration_percent, config["main"].getint("cluster_scan_period_sec", 0))
@@ -1,15 +1,20 @@
 import sys
 from utils import shell
 from utils import logger
+from utils import journal
 from monitor.cluster_monitor import DbClusterMonitor
+from monitor import config_validation
 
 if __name__ == '__main__':
-    logger.init_logging()
+    config_loaded, config = shell.load_config_ini()
+    config_errors = config_validation.validate_config(config) if config_loaded else []
+    for error in config_errors:
+        print(f"Invalid config: {error}", file=sys.stderr)
+    if not config_loaded or config_errors:
+        sys.exit(1)
 
-    config_loaded = False
-    config = {}
-    while not config_loaded:
-        config_loaded, config = shell.load_config_ini()
+    logger.init_logging(config)
+    journal.init_journal(config)
 
     app = DbClusterMonitor(config)
     sys.exit(app.start())
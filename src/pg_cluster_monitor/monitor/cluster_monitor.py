@@ -1,11 +1,19 @@
 import time
 import logging
 from cluster.cluster import DbCluster
+from cluster import probes
 from monitor.master_db_handler import MasterDbHandler
 from monitor.standby_db_handler import StandbyDbHandler
 from cluster.cluster_node_role import DbRole
 from monitor.webserver import WebServer
+from monitor.cluster_view import ClusterView
+from monitor.health_check import HealthCheck
+from monitor.replication_slots_guard import ReplicationSlotsGuard
+from monitor.synchronous_replication_policy import SynchronousReplicationPolicy
+from monitor.node_rebuild import NodeRebuild
 from utils import shell
+from utils import journal
+from utils import db
 from threading import Lock
 
 
@@ -18,7 +26,9 @@ class DbClusterMonitor:
         self.logger.info(f"DbClusterMonitor started with config {config._sections}")
         main_config_section = config["main"]
         self.local_node_host_name = main_config_section["local_node_host_name"]
-        self.db_cluster = DbCluster(config.items("cluster"))
+        db.set_connect_timeout(main_config_section.getint("db_connect_timeout_sec", db.DEFAULT_CONNECT_TIMEOUT_SEC))
+        nodes_priority = [name.strip() for name in main_config_section.get("nodes_priority", "").split(",") if name.strip()]
+        self.db_cluster = DbCluster(config.items("cluster"), nodes_priority, probes.create_probe_registry(config))
         self.cluster_scan_period_sec = main_config_section.getint("cluster_scan_period_sec")
         self.get_network_status_string_command = main_config_section["cmd_get_network_status_string"]
         self.success_network_status_string = main_config_section["cmd_success_network_status_string"]
@@ -30,6 +40,7 @@ class DbClusterMonitor:
         self.start_db_command = main_config_section["cmd_start_db"]
         self.stop_db_command = main_config_section["cmd_stop_db"]
         self.isRunning = None
+        self.is_initialized = False
         self.replication_slot_name = main_config_section["replication_slot_name"]
         self.pg_rewind_command = main_config_section["cmd_pg_rewind_command"]
         self.pg_basebackup_command = main_config_section["cmd_pg_basebackup_command"]
@@ -37,9 +48,42 @@ class DbClusterMonitor:
         self.create_db_directories_command = main_config_section["cmd_create_db_directories"]
         self.remove_db_directories_command = main_config_section["cmd_remove_db_directories"]
         self.get_cluster_state_lock = Lock()
-        self.webserver = WebServer(self.get_cluster_state, main_config_section["webserver_address"], int(main_config_section["webserver_port"]))
+        self.cluster_view = ClusterView()
+        self.db_cluster.subscribe(self.cluster_view.on_cluster_changed)
+        self.health_check = HealthCheck(self.local_node_host_name, main_config_section.getint(
+            "health_check_max_scan_age_sec", 3 * self.cluster_scan_period_sec))
+        self.db_cluster.subscribe(self.health_check.on_cluster_changed)
+        self.db_cluster.subscribe_node_updated(self.health_check.on_node_updated)
+        self.node_rebuild = NodeRebuild(main_config_section.get("rebuild_max_rate", "").strip(),
+                                        main_config_section.getint("rebuild_progress_poll_period_sec", 5))
+        self.webserver = WebServer(self.get_cluster_state, journal.get_events, self.cluster_view, self.health_check,
+                                   self.node_rebuild.get_progress, self.db_cluster.get_probes_stats, self.get_service_state, main_config_section["webserver_address"], int(main_config_section["webserver_port"]))
         self.timeout_to_check_replication_status_after_start_sec = main_config_section.getint("timeout_to_check_replication_status_after_start_sec")
 
+        self.synchronous_replication_policy = SynchronousReplicationPolicy(
+            main_config_section.get("synchronous_replication_mode", "star").strip().lower(),
+            main_config_section.getint("synchronous_standby_count", 1),
+            main_config_section.getint("synchronous_standby_max_flush_lag_bytes", 16777216),
+            main_config_section.getint("synchronous_standby_hysteresis_scans", 3))
+
+        # handlers live as long as the service and are notified about changes of the cluster state after each scan
+        self.master_db_handler = MasterDbHandler(self.local_node_host_name, self.start_db_command, self.stop_db_command,
+                                                 self.pg_rewind_command, self.pg_basebackup_command, self.pg_data_path, self.replication_slot_name,
+                                                 self.create_db_directories_command, self.remove_db_directories_command, self.timeout_to_downgrade_master_sec,
+                                                 self.timeout_to_check_replication_status_after_start_sec, self.synchronous_replication_policy,
+                                                 self.node_rebuild)
+        self.standby_db_handler = StandbyDbHandler(self.local_node_host_name, self.get_network_status_string_command,
+                                                   self.timeout_to_failover_sec, self.promote_command, self.replication_slot_name,
+                                                   self.success_network_status_string)
+        self.db_cluster.subscribe(self.master_db_handler.on_cluster_changed)
+        self.db_cluster.subscribe(self.standby_db_handler.on_cluster_changed)
+
+        self.replication_slots_guard = ReplicationSlotsGuard(
+            self.local_node_host_name, self.replication_slot_name,
+            main_config_section.getint("replication_slot_max_retained_bytes", 1073741824),
+            main_config_section.getint("replication_slot_drop_inactive_after_sec", 0))
+        self.db_cluster.subscribe(self.replication_slots_guard.on_cluster_changed)
+
     def check_local_postgre_sql_server_status(self):
         """If the local PostgreSQL server is not running - try to run and wait for the server. If the server is still
         not available - return False. """
@@ -55,6 +99,10 @@ class DbClusterMonitor:
 
         return True
 
+    def get_service_state(self):
+        """Returns 'initializing' until the first scan of the cluster has finished, then 'ok'."""
+        return "ok" if self.is_initialized else "initializing"
+
     def get_cluster_state(self):
         """Returns the state of the cluster as json, threadsafe."""
         with self.get_cluster_state_lock:
@@ -69,6 +117,10 @@ class DbClusterMonitor:
 
         # gather information from cluster nodes
         self.db_cluster.update()
+        if not self.is_initialized:
+            self.is_initialized = True
+            self.logger.info("The first scan of the cluster has finished.")
+
         if not (self.local_node_host_name in self.db_cluster.nodes):
             self.logger.error(f"Local DB with host name {self.local_node_host_name} is not in the cluster.")
             return
@@ -80,20 +132,15 @@ class DbClusterMonitor:
             return
 
         # consider cluster state
-        db = None
+        db_handler = None
         if node_info.state.db_role == DbRole.MASTER:
-            db = MasterDbHandler(self.local_node_host_name, self.start_db_command, self.stop_db_command,
-                                 self.pg_rewind_command, self.pg_basebackup_command, self.pg_data_path, self.replication_slot_name,
-                                 self.create_db_directories_command, self.remove_db_directories_command, self.timeout_to_downgrade_master_sec,
-                                 self.timeout_to_check_replication_status_after_start_sec)
+            db_handler = self.master_db_handler
 
         if node_info.state.db_role == DbRole.STANDBY:
-            db = StandbyDbHandler(self.local_node_host_name, self.get_network_status_string_command,
-                                  self.timeout_to_failover_sec, self.promote_command, self.replication_slot_name,
-                                  self.success_network_status_string)
+            db_handler = self.standby_db_handler
 
-        if db:
-            db.handle_cluster_state(self.db_cluster)
+        if db_handler:
+            db_handler.handle_cluster_state(self.db_cluster)
 
     def stop(self):
         """Stop service."""
@@ -102,7 +149,8 @@ class DbClusterMonitor:
         self.isRunning = False
 
     def start(self):
-        """Start service and run the main monitoring cycle of the DB cluster."""
+        """Start service and run the main monitoring cycle of the DB cluster. The webserver is started before
+        the first scan, so it reports 'initializing' state while nodes are being connected."""
         self.logger.info("Service is starting.")
         self.isRunning = True
         self.webserver.start()
@@ -0,0 +1,69 @@
+import collections
+import copy
+from threading import Condition
+
+MAX_DELTAS_IN_HISTORY = 1000
+
+
+class ClusterView:
+    """Keeps a compact view of the cluster - connection and role of each node - with a version which is incremented
+    on every change. Clients wait for changes after a known version and get only the changed nodes."""
+
+    def __init__(self):
+        self.version = 0
+        self.nodes = {}
+        self.deltas = collections.deque(maxlen=MAX_DELTAS_IN_HISTORY)
+        self.condition = Condition()
+
+    @staticmethod
+    def get_node_view(node):
+        return {"connected": node.connected, "role": str(node.state.db_role)}
+
+    def on_cluster_changed(self, cluster, diff):
+        """Publishes a new version of the view if connection or role of some node has changed."""
+        if diff is not None and not diff.masters_changed and not diff.standbys_changed and \
+                not any(diff.is_node_changed(name, "connected", "db_role") for name in cluster.nodes):
+            return
+
+        self.publish(cluster)
+
+    def publish(self, cluster):
+        """Compares the cluster with the current view and increments the version if anything has changed."""
+        with self.condition:
+            delta = {}
+            for name, node in cluster.nodes.items():
+                node_view = self.get_node_view(node)
+                if self.nodes.get(name) != node_view:
+                    delta[name] = node_view
+
+            if not delta:
+                return
+
+            self.nodes.update(delta)
+            self.version += 1
+            self.deltas.append((self.version, delta))
+            self.condition.notify_all()
+
+    def get_snapshot(self):
+        with self.condition:
+            return {"version": self.version, "full": True, "nodes": copy.deepcopy(self.nodes)}
+
+    def get_changes(self, since):
+        """Returns nodes changed after the given version. Returns the full view if the version is unknown or too old."""
+        with self.condition:
+            if since > self.version or since <= 0 or not self.deltas or self.deltas[0][0] > since + 1:
+                return self.get_snapshot()
+
+            nodes = {}
+            for version, delta in self.deltas:
+                if version > since:
+                    nodes.update(delta)
+            return {"version": self.version, "full": False, "nodes": copy.deepcopy(nodes)}
+
+    def wait_for_changes(self, since, timeout):
+        """Blocks until the version becomes greater than `since` or timeout expires.
+        Returns changes after `since` or None on timeout."""
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.version != since, timeout):
+                return None
+            return self.get_changes(since)
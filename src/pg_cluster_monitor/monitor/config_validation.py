@@ -0,0 +1,137 @@
+import configparser
+import logging
+from cluster import probes
+from monitor.synchronous_replication_policy import SynchronousReplicationPolicy
+
+REQUIRED_MAIN_CONFIG_KEYS = (
+    "local_node_host_name", "pg_data_path", "cmd_create_db_directories", "cmd_remove_db_directories", "replication_slot_name",
+    "cluster_scan_period_sec", "timeout_to_failover_sec", "timeout_to_downgrade_master_sec",
+    "timeout_to_check_replication_status_after_start_sec", "cmd_get_network_status_string", "cmd_success_network_status_string",
+    "cmd_get_db_status_string", "cmd_success_db_status_string", "cmd_promote_standby_to_master", "cmd_pg_rewind_command",
+    "cmd_pg_basebackup_command", "cmd_start_db", "cmd_stop_db", "webserver_address", "webserver_port")
+
+INTEGER_MAIN_CONFIG_KEYS = (
+    "cluster_scan_period_sec", "timeout_to_failover_sec", "timeout_to_downgrade_master_sec",
+    "timeout_to_check_replication_status_after_start_sec", "webserver_port", "log_queue_max_size",
+    "events_journal_max_bytes", "events_journal_backup_count", "health_check_max_scan_age_sec",
+    "replication_slot_max_retained_bytes", "replication_slot_drop_inactive_after_sec", "synchronous_standby_count",
+    "synchronous_standby_max_flush_lag_bytes", "synchronous_standby_hysteresis_scans", "rebuild_progress_poll_period_sec",
+    "probe_max_duration_percent", "db_connect_timeout_sec")
+INTEGER_PROBE_CONFIG_KEYS = ("interval_sec", "timeout_ms")
+LOG_LEVEL_MAIN_CONFIG_KEYS = ("log_console_level", "log_file_level")
+
+
+def validate_integer_config_keys(section_name, section, keys):
+    """Checks that the settings of the section which are present have integer values. Returns the list of errors."""
+    errors = []
+    for key in keys:
+        if key in section:
+            try:
+                section.getint(key)
+            except ValueError:
+                errors.append(f"Setting `{key}` of section [{section_name}] must be an integer, but it is '{section[key]}'.")
+    return errors
+
+
+def validate_config(config):
+    """Checks that config.ini contains all required settings with valid values. Returns the list of errors."""
+    errors = []
+    if not config.has_section("cluster") or not config.options("cluster"):
+        errors.append("Section [cluster] must contain at least one node in format `hostName = connectionString`.")
+    else:
+        errors.extend(validate_section_interpolation(config, "cluster"))
+    if not config.has_section("main"):
+        errors.append("Section [main] is absent.")
+        return errors
+
+    main_config_section = config["main"]
+    for key in REQUIRED_MAIN_CONFIG_KEYS:
+        if key not in main_config_section:
+            errors.append(f"Setting `{key}` is absent in section [main].")
+
+    # values are interpolated on reading, so a single `%` in a value fails
+    try:
+        errors.extend(validate_integer_config_keys("main", main_config_section, INTEGER_MAIN_CONFIG_KEYS))
+        errors.extend(validate_main_config_values(main_config_section))
+        errors.extend(validate_cluster_node_names(config, main_config_section))
+    except configparser.Error as ex:
+        errors.append(f"Section [main] cannot be read, `%` must be written as `%%`: {ex}")
+
+    errors.extend(validate_probe_sections(config))
+    return errors
+
+
+def validate_section_interpolation(config, section_name):
+    """Checks that all values of the section can be read. Returns the list of errors."""
+    try:
+        config.items(section_name)
+    except configparser.Error as ex:
+        return [f"Section [{section_name}] cannot be read, `%` must be written as `%%`: {ex}"]
+    return []
+
+
+def validate_main_config_values(main_config_section):
+    """Checks settings of section [main] which accept a fixed set of values. Returns the list of errors."""
+    errors = []
+    mode = main_config_section.get("synchronous_replication_mode", "star").strip().lower()
+    if mode not in SynchronousReplicationPolicy.MODES:
+        errors.append(f"Setting `synchronous_replication_mode` must be one of {SynchronousReplicationPolicy.MODES}, but it is '{mode}'.")
+
+    for key in LOG_LEVEL_MAIN_CONFIG_KEYS:
+        if key in main_config_section and not isinstance(logging.getLevelName(main_config_section[key].strip().upper()), int):
+            errors.append(f"Setting `{key}` must be one of DEBUG, INFO, WARNING, ERROR or CRITICAL, but it is '{main_config_section[key]}'.")
+
+    return errors
+
+
+def validate_cluster_node_names(config, main_config_section):
+    """Checks that the local node and nodes of `nodes_priority` are defined in section [cluster]. Returns the list of errors."""
+    if not config.has_section("cluster"):
+        return []
+
+    errors = []
+    local_node_host_name = main_config_section.get("local_node_host_name")
+    if local_node_host_name and not config.has_option("cluster", local_node_host_name):
+        errors.append(f"Local node `{local_node_host_name}` is not in section [cluster].")
+
+    for node_host_name in main_config_section.get("nodes_priority", "").split(","):
+        if node_host_name.strip() and not config.has_option("cluster", node_host_name.strip()):
+            errors.append(f"Node `{node_host_name.strip()}` of `nodes_priority` is not in section [cluster].")
+
+    return errors
+
+
+def validate_probe_sections(config):
+    """Checks all `[probe.<name>]` sections of the config. Returns the list of errors."""
+    errors = []
+    builtin_probe_names = {probe.name for probe in probes.get_builtin_probes()}
+    for section_name in config.sections():
+        if section_name.startswith(probes.PROBE_SECTION_PREFIX):
+            try:
+                errors.extend(validate_probe_config(section_name, config[section_name], builtin_probe_names))
+            except configparser.Error as ex:
+                errors.append(f"Section [{section_name}] cannot be read, `%` must be written as `%%`: {ex}")
+    return errors
+
+
+def validate_probe_config(section_name, section, builtin_probe_names):
+    """Checks settings of a probe defined by `[probe.<name>]` section. `sql` may be absent only in sections
+    which override settings of built-in probes."""
+    errors = []
+    name = section_name[len(probes.PROBE_SECTION_PREFIX):]
+    if name not in builtin_probe_names and not section.get("sql", "").strip():
+        errors.append(f"Setting `sql` of section [{section_name}] is absent or empty.")
+    elif "sql" in section and not section["sql"].strip():
+        errors.append(f"Setting `sql` of section [{section_name}] is empty.")
+
+    for key in probes.FIXED_PROBE_SETTINGS.get(name, ()):
+        if key in section:
+            errors.append(f"Setting `{key}` of section [{section_name}] cannot be overridden.")
+
+    errors.extend(validate_integer_config_keys(section_name, section, INTEGER_PROBE_CONFIG_KEYS))
+
+    for role in section.get("roles", "").split(","):
+        if role.strip() and role.strip().lower() not in probes.ROLES:
+            errors.append(f"Unknown role '{role.strip()}' in section [{section_name}], expected one of {tuple(probes.ROLES.keys())}.")
+
+    return errors
@@ -0,0 +1,119 @@
+import datetime
+from cluster.cluster_node_role import DbRole
+
+
+class HealthCheck:
+    """Answers health checks of load balancers about the local node using the result of the last cluster scan,
+    so the checks don't make any round trips to the DB. The age of the result is renewed as soon as the local node
+    has been updated. A result which is older than `max_snapshot_age_sec`
+    is considered unhealthy, e.g. when the monitoring cycle has hung."""
+
+    def __init__(self, local_node_host_name, max_snapshot_age_sec):
+        self.local_node_host_name = local_node_host_name
+        self.max_snapshot_age_sec = max_snapshot_age_sec
+        self.snapshot = None
+
+    @staticmethod
+    def get_replication_lag_in_bytes(cluster, node):
+        """Returns the difference between WAL positions of the single master and the given standby node."""
+        if len(cluster.connected_master_nodes_names) != 1:
+            return None
+
+        master_node = cluster.nodes[cluster.connected_master_nodes_names[0]]
+        if not master_node.state.current_lsn_as_number or not node.state.current_lsn_as_number:
+            return None
+
+        return max(master_node.state.current_lsn_as_number - node.state.current_lsn_as_number, 0)
+
+    def on_cluster_changed(self, cluster, diff):
+        """Takes the snapshot of the local node after each scan."""
+        node = cluster.nodes.get(self.local_node_host_name)
+        if node is None:
+            return
+
+        ranked_master_nodes = cluster.get_ranked_master_nodes()
+        is_primary = node.connected and node.state.db_role == DbRole.MASTER \
+            and len(ranked_master_nodes) > 0 and ranked_master_nodes[0].host_name == node.host_name
+        is_replica = node.connected and node.state.db_role == DbRole.STANDBY
+
+        # the snapshot is replaced as a whole, so readers from other threads always see a consistent one
+        self.snapshot = {
+            "node": node.host_name,
+            "connected": node.connected,
+            "role": str(node.state.db_role),
+            "is_primary": is_primary,
+            "is_replica": is_replica,
+            "lag_bytes": self.get_replication_lag_in_bytes(cluster, node) if is_replica else None,
+            "time": datetime.datetime.now()
+        }
+
+    def on_node_updated(self, cluster, node):
+        """Renews the snapshot right after the local node has been updated, so a slow scan of other nodes, e.g. an
+        unreachable one, does not make the local node unhealthy. Attributes which depend on other nodes, such as the rank
+        of the master and the replication lag, are kept from the last full scan while the role of the node is the same."""
+        if node.host_name != self.local_node_host_name:
+            return
+
+        snapshot = self.snapshot
+        if snapshot is not None and snapshot["connected"] and node.connected and snapshot["role"] == str(node.state.db_role):
+            self.snapshot = dict(snapshot, time=datetime.datetime.now())
+            return
+
+        self.snapshot = {
+            "node": node.host_name,
+            "connected": node.connected,
+            "role": str(node.state.db_role),
+            "is_primary": False,
+            "is_replica": node.connected and node.state.db_role == DbRole.STANDBY,
+            "lag_bytes": None,
+            "time": datetime.datetime.now()
+        }
+
+    def get_fresh_snapshot(self):
+        """Returns the snapshot and its age, the snapshot is None if it is absent or outdated."""
+        snapshot = self.snapshot
+        if snapshot is None:
+            return None, None
+
+        age_sec = (datetime.datetime.now() - snapshot["time"]).total_seconds()
+        if age_sec > self.max_snapshot_age_sec:
+            return None, age_sec
+        return snapshot, age_sec
+
+    @staticmethod
+    def to_response(snapshot, age_sec, reason=None):
+        response = {key: value for key, value in snapshot.items() if key != "time"} if snapshot is not None else {}
+        response["age_sec"] = age_sec
+        if reason:
+            response["reason"] = reason
+        return response
+
+    def check_primary(self):
+        """Returns True and the details if the local node is the master which should receive writes.
+        In case of several masters only the one with the highest rank is healthy."""
+        snapshot, age_sec = self.get_fresh_snapshot()
+        if snapshot is None:
+            return False, self.to_response(self.snapshot, age_sec, "no fresh scan result")
+
+        if not snapshot["is_primary"]:
+            return False, self.to_response(snapshot, age_sec, "not primary")
+
+        return True, self.to_response(snapshot, age_sec)
+
+    def check_replica(self, max_lag_bytes=None):
+        """Returns True and the details if the local node is a connected standby,
+        and its replication lag does not exceed `max_lag_bytes` if it is given."""
+        snapshot, age_sec = self.get_fresh_snapshot()
+        if snapshot is None:
+            return False, self.to_response(self.snapshot, age_sec, "no fresh scan result")
+
+        if not snapshot["is_replica"]:
+            return False, self.to_response(snapshot, age_sec, "not replica")
+
+        if max_lag_bytes is not None:
+            if snapshot["lag_bytes"] is None:
+                return False, self.to_response(snapshot, age_sec, "replication lag is unknown")
+            if snapshot["lag_bytes"] > max_lag_bytes:
+                return False, self.to_response(snapshot, age_sec, "replication lag is too big")
+
+        return True, self.to_response(snapshot, age_sec)
@@ -1,9 +1,7 @@
 import logging
 import datetime
-import time
 from utils import db
-from utils import shell
-from cluster.cluster_node_role import DbRole
+from utils import journal
 
 
 class MasterDbHandler:
@@ -13,11 +11,12 @@ class MasterDbHandler:
     REPLICATION_SLOT_NAME_ATTR = "%slot_name%"
     PD_DATA_PATH_ATTR = "%pg_data_path%"
     PRIMARY_CONN_STR_ATTR = "%master_connstr%"
+    MAX_RATE_ATTR = "%max_rate%"
 
     def __init__(self, local_node_host_name, start_db_command, stop_db_command,
                  pg_rewind_command, pg_basebackup_command, pg_data_path, replication_slot_name,
                  create_db_directories_command, remove_db_directories_command, timeout_to_downgrade_master_sec,
-                 timeout_to_check_replication_status_after_start_sec):
+                 timeout_to_check_replication_status_after_start_sec, synchronous_replication_policy, node_rebuild):
         self.logger = logging.getLogger("logger")
         self.local_node_host_name = local_node_host_name
         self.start_db_command = start_db_command
@@ -30,34 +29,57 @@ class MasterDbHandler:
         self.remove_db_directories_command = remove_db_directories_command
         self.timeout_to_downgrade_master_sec = timeout_to_downgrade_master_sec
         self.timeout_to_check_replication_status_after_start_sec = timeout_to_check_replication_status_after_start_sec
+        self.synchronous_replication_policy = synchronous_replication_policy
+        self.node_rebuild = node_rebuild
+        self.synchronous_standby_names_check_required = True
 
-    def update_synchronous_standby_names(self, cluster):
-        """Check synchronous_standby_names depends on standby servers availability."""
-        conn_str = cluster.nodes[self.local_node_host_name].connection_string
-        current_synchronous_standby_names = cluster.nodes[self.local_node_host_name].state.synchronous_standby_names
-
-        if len(cluster.connected_standby_nodes_names) == 0 and not current_synchronous_standby_names == '':
-            self.logger.warning(f"Set synchronous_standby_names to '' for {self.local_node_host_name} because "
-                                f"there is no standby servers in the cluster.")
-            db.alter_postgre_sql_config(conn_str, 'synchronous_standby_names', '')
+    def on_cluster_changed(self, cluster, diff):
+        """Requests the check of synchronous_standby_names if the set of standby nodes or the local node has changed."""
+        if diff.standbys_changed or diff.is_node_changed(self.local_node_host_name):
+            self.synchronous_standby_names_check_required = True
 
-        if len(cluster.connected_standby_nodes_names) >= 1 and not current_synchronous_standby_names == '*':
-            self.logger.warning(f"Set synchronous_standby_names to '*' for {self.local_node_host_name} "
-                                f"because standby server has appeared.")
-            db.alter_postgre_sql_config(conn_str, 'synchronous_standby_names', '*')
+        # the list of synchronous standbys is seeded again when the local node becomes master
+        if diff.is_node_changed(self.local_node_host_name, "connected", "db_role"):
+            self.synchronous_replication_policy.reset()
 
-    def downgrade_local_master_db_to_standby(self, cluster, primary_connection_string):
+    def update_synchronous_standby_names(self, cluster):
+        """Check synchronous_standby_names depends on standby servers availability and lag, see SynchronousReplicationPolicy.
+        Returns True if the value is already relevant and nothing has been changed."""
+        local_node = cluster.nodes[self.local_node_host_name]
+        conn_str = local_node.connection_string
+        current_synchronous_standby_names = local_node.state.synchronous_standby_names
+        if current_synchronous_standby_names is None or local_node.state.replication_standbys is None:
+            self.logger.warning("Check of synchronous_standby_names is postponed because the state of standbys is unknown.")
+            return False
+
+        synchronous_standby_names = self.synchronous_replication_policy.get_synchronous_standby_names(
+            local_node.state.replication_standbys, len(cluster.connected_standby_nodes_names), current_synchronous_standby_names)
+        if current_synchronous_standby_names == synchronous_standby_names:
+            return True
+
+        self.logger.warning(f"Set synchronous_standby_names to '{synchronous_standby_names}' for {self.local_node_host_name}, "
+                            f"current value is '{current_synchronous_standby_names}', "
+                            f"the number of connected standby servers is {len(cluster.connected_standby_nodes_names)}.")
+        db.alter_postgre_sql_config(conn_str, 'synchronous_standby_names', synchronous_standby_names)
+        journal.write_event("synchronous_standby_names_changed", node=self.local_node_host_name,
+                            old=current_synchronous_standby_names, new=synchronous_standby_names)
+        return False
+
+    def downgrade_local_master_db_to_standby(self, cluster, master_node):
         """Executes sync command. If after executing rewind command replication does not work
-        then executes pg_basebackup command"""
+        then executes pg_basebackup command. Progress of the steps is tracked by NodeRebuild."""
+        primary_connection_string = master_node.connection_string
 
         self.logger.critical("Trying to downgrade the local master DB to standby using pg_rewind.")
+        journal.write_event("pg_rewind_started", node=self.local_node_host_name)
+        self.node_rebuild.begin("pg_rewind", master_node.host_name)
 
-        shell.execute_cmd(self.stop_db_command)
-        shell.execute_cmd(self.pg_rewind_command.replace(self.PD_DATA_PATH_ATTR, self.pg_data_path).replace(self.PRIMARY_CONN_STR_ATTR, primary_connection_string))
-        shell.execute_cmd(self.start_db_command)
+        self.node_rebuild.run_command("stop_db", self.stop_db_command)
+        self.node_rebuild.run_command("pg_rewind", self.pg_rewind_command.replace(self.PD_DATA_PATH_ATTR, self.pg_data_path).replace(self.PRIMARY_CONN_STR_ATTR, primary_connection_string))
+        self.node_rebuild.run_command("start_db", self.start_db_command)
 
         self.logger.debug(f"Waiting for the replication starting for {self.timeout_to_check_replication_status_after_start_sec} sec.")
-        time.sleep(self.timeout_to_check_replication_status_after_start_sec)
+        self.node_rebuild.wait("wait_for_replication", self.timeout_to_check_replication_status_after_start_sec)
         self.logger.info("Checking the replication status.")
 
         # check replication status
@@ -65,37 +87,33 @@ class MasterDbHandler:
 
         if err or status is None or status != self.SUCCESS_REPLICATION_STATUS:
             self.logger.critical(f"Downgrade the local master DB to standby using pg_rewind has failed. Streaming status = {status}. Trying to downgrade using pg_basebackup.")
-            shell.execute_cmd(self.stop_db_command)
-            shell.execute_cmd(self.remove_db_directories_command)
-            shell.execute_cmd(self.create_db_directories_command)
-            shell.execute_cmd(self.pg_basebackup_command.replace(self.PD_DATA_PATH_ATTR, self.pg_data_path).replace(self.PRIMARY_CONN_STR_ATTR, primary_connection_string).replace(self.REPLICATION_SLOT_NAME_ATTR, self.replication_slot_name))
-            shell.execute_cmd(self.start_db_command)
+            journal.write_event("pg_rewind_failed", node=self.local_node_host_name, status=status)
+            self.node_rebuild.finish(False)
+
+            journal.write_event("pg_basebackup_started", node=self.local_node_host_name)
+            self.node_rebuild.begin("pg_basebackup", master_node.host_name)
+            if self.node_rebuild.max_rate and self.MAX_RATE_ATTR not in self.pg_basebackup_command:
+                self.logger.warning(f"Transfer rate of pg_basebackup won't be limited because cmd_pg_basebackup_command does not contain {self.MAX_RATE_ATTR}.")
+            self.node_rebuild.run_command("stop_db", self.stop_db_command)
+            self.node_rebuild.run_command("remove_db_directories", self.remove_db_directories_command)
+            self.node_rebuild.run_command("create_db_directories", self.create_db_directories_command)
+            self.node_rebuild.run_basebackup(self.pg_basebackup_command.replace(self.PD_DATA_PATH_ATTR, self.pg_data_path).replace(self.PRIMARY_CONN_STR_ATTR, primary_connection_string).replace(self.REPLICATION_SLOT_NAME_ATTR, self.replication_slot_name).replace(self.MAX_RATE_ATTR, self.node_rebuild.get_max_rate_option()),
+                                             primary_connection_string)
+            self.node_rebuild.run_command("start_db", self.start_db_command)
+            self.node_rebuild.finish(True)
             self.logger.critical("Downgrade the local master DB to standby using pg_basebackup has completed.")
+            journal.write_event("pg_basebackup_completed", node=self.local_node_host_name)
             return
 
+        self.node_rebuild.finish(True)
         self.logger.critical("Downgrade the local master DB to standby using pg_rewind has completed successfully.")
+        journal.write_event("pg_rewind_completed", node=self.local_node_host_name)
 
-    def try_get_master_node_with_the_biggest_db(self, cluster):
-        """Tries get DB node with the biggest DB size.
+    def try_get_master_node_with_the_highest_rank(self, cluster):
+        """Tries get DB node which deserves to stay master, see `master_ranking.get_master_node_rank`.
            If DB node has found then returns node otherwise returns None"""
-
-        # todo: checking the size of the database may not be enough,
-        # consider checking other possible replication attributes or DB parameters to find out if the DB has the priority
-
-        max_db_size = 0
-        master_node_with_max_db_size = None
-
-        for nodeName, attrs in cluster.nodes.items():
-            node = cluster.nodes[nodeName]
-
-            if node.state.db_role != DbRole.MASTER or not node.connected:
-                continue
-
-            if node.state.db_size_in_bytes is not None and node.state.db_size_in_bytes > max_db_size:
-                max_db_size = node.state.db_size_in_bytes
-                master_node_with_max_db_size = node
-
-        return master_node_with_max_db_size
+        ranked_master_nodes = cluster.get_ranked_master_nodes()
+        return ranked_master_nodes[0] if ranked_master_nodes else None
 
     def consider_decision_to_downgrade_master_to_standby(self, cluster):
         """Analyzes the priority of the current master against others and consider a decision to restore the local DB
@@ -112,29 +130,37 @@ class MasterDbHandler:
             self.logger.warn(f"Downgrade won't be considered because there are several masters DB in the cluster for {time_delta_sec} sec, but timeout to downgrade is {self.timeout_to_downgrade_master_sec} sec.")
             return
 
-        master_node_with_the_biggest_db = self.try_get_master_node_with_the_biggest_db(cluster)
+        master_node_with_the_highest_rank = self.try_get_master_node_with_the_highest_rank(cluster)
 
-        if master_node_with_the_biggest_db is None:
-            self.logger.critical("Downgrade to standby won't be performed on this node. Master node with the biggest DB size has not found.")
+        if master_node_with_the_highest_rank is None:
+            self.logger.critical("Downgrade to standby won't be performed on this node. Master node with the highest rank has not found.")
             return
 
         local_node = cluster.nodes[self.local_node_host_name]
 
-        self.logger.warn(f"Name of the master node with the biggest DB size = {master_node_with_the_biggest_db.host_name}. "
-                         f"DB size of the master node with the biggest DB size = {master_node_with_the_biggest_db.state.db_size_in_bytes}")
+        self.logger.warn(f"Name of the master node with the highest rank = {master_node_with_the_highest_rank.host_name}. "
+                         f"Timeline = {master_node_with_the_highest_rank.state.timeline_id}, "
+                         f"WAL position = {master_node_with_the_highest_rank.state.current_lsn}, "
+                         f"last transaction time = {master_node_with_the_highest_rank.state.last_transaction_time}")
         self.logger.warn(f"Name of the local node = {self.local_node_host_name}. "
-                         f"DB size of the local node = {local_node.state.db_size_in_bytes}")
+                         f"Timeline = {local_node.state.timeline_id}, "
+                         f"WAL position = {local_node.state.current_lsn}, "
+                         f"last transaction time = {local_node.state.last_transaction_time}")
 
-        if master_node_with_the_biggest_db.state.db_size_in_bytes == local_node.state.db_size_in_bytes:
-            self.logger.critical("Local master DB won't be downgraded to standby DB because It has the biggest DB size of all master DB.")
+        if master_node_with_the_highest_rank.host_name == local_node.host_name:
+            self.logger.critical("Local master DB won't be downgraded to standby DB because It has the highest rank of all master DB.")
             return
 
-        self.downgrade_local_master_db_to_standby(cluster, master_node_with_the_biggest_db.connection_string)
+        journal.write_event("downgrade_to_standby", node=self.local_node_host_name, new_master=master_node_with_the_highest_rank.host_name)
+        self.downgrade_local_master_db_to_standby(cluster, master_node_with_the_highest_rank)
 
     def handle_cluster_state(self, cluster):
         """Considers the current state of the cluster and perform actions for the current master DB node."""
 
-        self.update_synchronous_standby_names(cluster)
+        # the value is checked again on the next scan after it has been changed,
+        # policies which depend on the replication lag are checked on every scan
+        if self.synchronous_standby_names_check_required or self.synchronous_replication_policy.mode != "star":
+            self.synchronous_standby_names_check_required = not self.update_synchronous_standby_names(cluster)
 
         # two or more masters detected
         if len(cluster.connected_master_nodes_names) > 1:
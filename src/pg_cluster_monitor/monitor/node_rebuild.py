@@ -0,0 +1,117 @@
+import copy
+import datetime
+import logging
+import time
+from threading import Lock
+from utils import db
+from utils import shell
+
+
+class NodeRebuild:
+    """Runs the steps of rebuilding the local DB from another node (pg_rewind, pg_basebackup, start/stop of the DB)
+    and tracks their progress, so the phase, transferred bytes and ETA are visible through the webserver.
+    Progress of pg_basebackup is read from pg_stat_progress_basebackup of the source node (PostgreSQL 13+)."""
+
+    BASEBACKUP_PROGRESS_SQL = "SELECT p.phase, p.backup_total, p.backup_streamed FROM pg_stat_progress_basebackup p " \
+                              "JOIN pg_stat_activity a ON a.pid = p.pid WHERE a.application_name = 'pg_basebackup' " \
+                              "ORDER BY a.backend_start DESC LIMIT 1"
+    BASEBACKUP_PROGRESS_TIMEOUT_MS = 5000
+    # SQLSTATE of undefined_table, pg_stat_progress_basebackup appeared in PostgreSQL 13
+    UNDEFINED_TABLE_ERROR_CODE = "42P01"
+
+    def __init__(self, max_rate, progress_poll_period_sec):
+        self.logger = logging.getLogger("logger")
+        self.max_rate = max_rate
+        self.progress_poll_period_sec = progress_poll_period_sec
+        self.lock = Lock()
+        self.progress = {"state": "idle"}
+        self.phase_start_time = None
+        self.is_basebackup_progress_available = True
+
+    def get_max_rate_option(self):
+        """Returns --max-rate option of pg_basebackup which limits the transfer rate or empty string if the rate is unlimited."""
+        return f"--max-rate={self.max_rate}" if self.max_rate else ""
+
+    def get_progress(self):
+        """Returns the progress of the current or the last rebuild, threadsafe."""
+        with self.lock:
+            return copy.deepcopy(self.progress)
+
+    def update_progress(self, **attrs):
+        with self.lock:
+            self.progress.update(attrs)
+
+    def begin(self, method, source_host_name):
+        """Starts tracking of a new rebuild."""
+        with self.lock:
+            self.progress = {"state": "running", "method": method, "source": source_host_name, "phase": None,
+                             "phases": [], "started": str(datetime.datetime.now()), "finished": None,
+                             "bytes_total": None, "bytes_done": None, "eta_sec": None}
+
+    def finish(self, success):
+        now = datetime.datetime.now()
+        with self.lock:
+            self.finish_phase(now)
+            self.progress.update(state="completed" if success else "failed", phase=None, finished=str(now))
+
+    def finish_phase(self, now):
+        if self.progress.get("phases") and self.progress["phases"][-1]["finished"] is None:
+            phase = self.progress["phases"][-1]
+            phase["finished"] = str(now)
+            phase["duration_sec"] = round((now - self.phase_start_time).total_seconds(), 3)
+
+    def begin_phase(self, name):
+        self.logger.info(f"Rebuild of the local DB: phase '{name}' has started.")
+        now = datetime.datetime.now()
+        with self.lock:
+            self.finish_phase(now)
+            self.progress["phase"] = name
+            self.progress["phases"].append({"name": name, "started": str(now), "finished": None, "duration_sec": None})
+            self.phase_start_time = now
+
+    def run_command(self, phase, cmd):
+        """Runs external command as a tracked phase and returns its output."""
+        self.begin_phase(phase)
+        return shell.execute_cmd(cmd)
+
+    def wait(self, phase, timeout_sec):
+        """Waits as a tracked phase."""
+        self.begin_phase(phase)
+        time.sleep(timeout_sec)
+
+    def run_basebackup(self, cmd, source_connection_string):
+        """Runs pg_basebackup command as a tracked phase, polling its progress on the source node."""
+        self.begin_phase("pg_basebackup")
+        self.is_basebackup_progress_available = True
+        started = time.monotonic()
+        return shell.execute_cmd_with_progress(cmd, lambda: self.update_basebackup_progress(source_connection_string, started),
+                                               self.progress_poll_period_sec)
+
+    def update_basebackup_progress(self, source_connection_string, started):
+        if not self.is_basebackup_progress_available:
+            return
+
+        try:
+            conn = db.connect(source_connection_string)
+            try:
+                rows = db.fetch_all_with_timeout(conn, self.BASEBACKUP_PROGRESS_SQL, self.BASEBACKUP_PROGRESS_TIMEOUT_MS)
+            finally:
+                conn.close()
+        except Exception as ex:
+            if getattr(ex, "pgcode", None) == self.UNDEFINED_TABLE_ERROR_CODE:
+                self.logger.warning("Progress of pg_basebackup is not available on the source node, it requires PostgreSQL 13 or higher.")
+                self.is_basebackup_progress_available = False
+            else:
+                self.logger.warning(f"Cannot read the progress of pg_basebackup on the source node, it will be retried: {ex}")
+            return
+        if not rows:
+            return
+
+        backup_phase, bytes_total, bytes_done = rows[0]
+        eta_sec = None
+        elapsed_sec = time.monotonic() - started
+        if bytes_total and bytes_done and elapsed_sec > 0:
+            eta_sec = int((bytes_total - bytes_done) / (bytes_done / elapsed_sec))
+
+        self.update_progress(basebackup_phase=backup_phase, bytes_total=bytes_total, bytes_done=bytes_done, eta_sec=eta_sec)
+        self.logger.info(f"Rebuild of the local DB: pg_basebackup {backup_phase}, {bytes_done} of {bytes_total} bytes, ETA = {eta_sec} sec.")
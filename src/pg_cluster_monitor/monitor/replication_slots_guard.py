@@ -0,0 +1,72 @@
+import logging
+import datetime
+from utils import db
+from utils import journal
+from cluster.cluster_node_role import DbRole
+
+
+class ReplicationSlotsGuard:
+    """Watches the amount of WAL retained by replication slots of the local master DB. Alerts when a slot retains more
+    than `max_retained_bytes` and drops slots which have been inactive for more than `drop_inactive_after_sec`,
+    so WAL of abandoned slots does not fill the disk. Zero value of a threshold disables the related check.
+    The slot of the service (`replication_slot_name`) is never dropped, it is needed to rebuild the former master."""
+
+    def __init__(self, local_node_host_name, replication_slot_name, max_retained_bytes, drop_inactive_after_sec):
+        self.logger = logging.getLogger("logger")
+        self.local_node_host_name = local_node_host_name
+        self.replication_slot_name = replication_slot_name
+        self.max_retained_bytes = max_retained_bytes
+        self.drop_inactive_after_sec = drop_inactive_after_sec
+        self.inactive_slots_start_time = {}
+        self.slots_exceeding_retention = set()
+
+    def on_cluster_changed(self, cluster, diff):
+        """Checks slots of the local node after each scan if the node is master."""
+        node = cluster.nodes.get(self.local_node_host_name)
+        if node is None or not node.connected or node.state.db_role != DbRole.MASTER:
+            self.inactive_slots_start_time = {}
+            return
+
+        slots = node.state.replication_slots
+        now = datetime.datetime.now()
+
+        # forget slots which have gone
+        self.inactive_slots_start_time = {name: start_time for name, start_time in self.inactive_slots_start_time.items() if name in slots}
+        self.slots_exceeding_retention &= set(slots.keys())
+
+        for slot_name, slot in slots.items():
+            self.check_retained_bytes(slot_name, slot)
+
+            if slot["active"]:
+                self.inactive_slots_start_time.pop(slot_name, None)
+                continue
+
+            inactive_start_time = self.inactive_slots_start_time.setdefault(slot_name, now)
+            inactive_sec = (now - inactive_start_time).total_seconds()
+            if 0 < self.drop_inactive_after_sec <= inactive_sec and slot_name != self.replication_slot_name:
+                self.drop_slot(node, slot_name, slot, inactive_sec)
+
+    def check_retained_bytes(self, slot_name, slot):
+        """Alerts once when the slot starts retaining more WAL than allowed and when it goes back to normal."""
+        if self.max_retained_bytes <= 0 or slot["retained_bytes"] is None:
+            return
+
+        if slot["retained_bytes"] > self.max_retained_bytes:
+            self.logger.warning(f"Replication slot {slot_name} retains {slot['retained_bytes']} bytes of WAL, "
+                                f"growth rate = {slot['growth_bytes_per_sec']} bytes/sec, active = {slot['active']}.")
+            if slot_name not in self.slots_exceeding_retention:
+                self.slots_exceeding_retention.add(slot_name)
+                journal.write_event("replication_slot_retention_exceeded", node=self.local_node_host_name, slot=slot_name,
+                                    retained_bytes=slot["retained_bytes"], active=slot["active"])
+        elif slot_name in self.slots_exceeding_retention:
+            self.slots_exceeding_retention.discard(slot_name)
+            journal.write_event("replication_slot_retention_normal", node=self.local_node_host_name, slot=slot_name,
+                                retained_bytes=slot["retained_bytes"])
+
+    def drop_slot(self, node, slot_name, slot, inactive_sec):
+        self.logger.critical(f"Drop replication slot {slot_name} because it has been inactive for {inactive_sec} sec "
+                             f"and retains {slot['retained_bytes']} bytes of WAL.")
+        if db.execute(node.connection_string, f"SELECT pg_drop_replication_slot('{slot_name}')"):
+            self.inactive_slots_start_time.pop(slot_name, None)
+            journal.write_event("replication_slot_dropped", node=self.local_node_host_name, slot=slot_name,
+                                retained_bytes=slot["retained_bytes"], inactive_sec=int(inactive_sec))
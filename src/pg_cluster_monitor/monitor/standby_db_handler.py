@@ -2,6 +2,7 @@ import logging
 import datetime
 from utils import shell
 from utils import db
+from utils import journal
 from cluster.cluster_node_role import DbRole
 
 
@@ -17,6 +18,12 @@ class StandbyDbHandler:
         self.promote_command = promote_command
         self.replication_slot_name = replication_slot_name
         self.success_network_status_string = success_network_status_string
+        self.following_master_check_required = True
+
+    def on_cluster_changed(self, cluster, diff):
+        """Requests the check of primary_conninfo if the set of master nodes or the local node has changed."""
+        if diff.masters_changed or diff.is_node_changed(self.local_node_host_name):
+            self.following_master_check_required = True
 
     def check_network_connection(self):
         """Execute cmd_get_network_status_string command from config.ini and returns True if the result contains success_network_status_string from config.ini."""
@@ -34,6 +41,7 @@ class StandbyDbHandler:
     def do_failover(self, connection_string_to_local_db_node):
         """Execute promote command for performing DB failover."""
         self.logger.critical(f"Execute PROMOTE command for node {self.local_node_host_name}")
+        journal.write_event("promotion", node=self.local_node_host_name)
         shell.execute_cmd(self.promote_command)
 
         self.logger.warning(f"Execute CHECKPOINT command for node {self.local_node_host_name}")
@@ -99,25 +107,32 @@ class StandbyDbHandler:
         self.do_failover(cluster.nodes[self.local_node_host_name].connection_string)
 
     def check_following_master(self, cluster):
-        """Check that the current standby follows the single master."""
+        """Check that the current standby follows the single master.
+        Returns True if primary_conninfo already refers to the master and nothing has been changed."""
         self.logger.debug("Check that primary_conninfo refers to master DB.")
         local_db_node = cluster.nodes[self.local_node_host_name]
         master_db_node = cluster.nodes[cluster.connected_master_nodes_names[0]]
+        if local_db_node.state.primary_conn_info is None:
+            self.logger.warning("Check of primary_conninfo is postponed because its value is unknown.")
+            return False
 
         local_node_connection_string_attributes = shell.parse_postgre_sql_connection_string(local_db_node.state.primary_conn_info)
         master_db_node_connection_string_attributes = shell.parse_postgre_sql_connection_string(master_db_node.connection_string)
 
-        if local_node_connection_string_attributes['host'] == master_db_node_connection_string_attributes['host'] and \
-           local_node_connection_string_attributes['user'] == master_db_node_connection_string_attributes['user'] and \
-           local_node_connection_string_attributes['password'] == master_db_node_connection_string_attributes['password']:
+        if shell.get_postgre_sql_hosts_and_ports(local_node_connection_string_attributes) == \
+           shell.get_postgre_sql_hosts_and_ports(master_db_node_connection_string_attributes) and \
+           local_node_connection_string_attributes.get('user') == master_db_node_connection_string_attributes.get('user') and \
+           local_node_connection_string_attributes.get('password') == master_db_node_connection_string_attributes.get('password'):
             self.logger.debug("Attribute primary_conninfo refers to the relevant master DB node.")
-            return
+            return True
 
         self.logger.critical(f"Detects that the local standby DB is following a wrong master DB. \
             The current master connection string '{master_db_node.connection_string}' is different to the current \
             value of primary_conninfo '{local_db_node.state.primary_conn_info}'")
 
         db.alter_postgre_sql_config(local_db_node.connection_string, 'primary_conninfo', master_db_node.connection_string)
+        journal.write_event("primary_conninfo_changed", node=self.local_node_host_name, master=master_db_node.host_name)
+        return False
 
     def handle_cluster_state(self, cluster):
         """Considers the current state of the cluster and perform actions for the current standby DB node."""
@@ -134,8 +149,10 @@ class StandbyDbHandler:
 
         # exactly one master DB in the cluster
         if len(cluster.connected_master_nodes_names) == 1:
-            # check that the local standby DB node is following a given master DB node
-            self.check_following_master(cluster)
+            # check that the local standby DB node is following a given master DB node, the check is repeated
+            # only if the cluster has changed or primary_conninfo has been updated on the previous scan
+            if self.following_master_check_required:
+                self.following_master_check_required = not self.check_following_master(cluster)
 
         # many master DB nodes in the cluster
         if len(cluster.connected_master_nodes_names) > 1:
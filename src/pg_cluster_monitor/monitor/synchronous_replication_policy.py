@@ -0,0 +1,179 @@
+import logging
+import re
+
+
+class SynchronousReplicationPolicy:
+    """Chooses the value of synchronous_standby_names of the master DB.
+
+    Modes:
+        star  - '*' if there is any connected standby, otherwise '' (the default behaviour);
+        first - FIRST k (...) of healthy standbys;
+        any   - ANY k (...) of healthy standbys (quorum commit).
+
+    For `first` and `any` modes a standby is healthy if it is streaming and its flush lag does not exceed
+    `max_flush_lag_bytes`. A standby joins the list after `hysteresis_scans` healthy scans in a row and leaves it
+    after `hysteresis_scans` unhealthy scans in a row, so the config is not altered on every spike of the lag.
+    If the list is empty, healthy standbys join it at once, so the durability is never lowered while the hysteresis
+    window is filling. A disconnected standby leaves the list immediately, otherwise commits would wait for it.
+    On the first scan of the master the list is seeded from the current value of synchronous_standby_names.
+    If there are fewer than `standby_count` standbys in the list, it is padded with the other connected standbys
+    with the smallest flush lag, streaming ones first, so k is decreased only if fewer standbys are connected at all
+    and the durability is kept while the standbys are lagging. Padding standbys go after the healthy ones.
+
+    In `first` mode the order of the list is the priority of standbys. Standbys are ordered by their flush lag
+    measured in steps of a quarter of `max_flush_lag_bytes`, and a new order is applied only after it has been
+    the same for `hysteresis_scans` scans in a row, so the synchronous standby does not flap."""
+
+    MODES = ("star", "first", "any")
+    STREAMING_STATE = "streaming"
+    STANDBY_NAMES_LIST_REGEX = re.compile(r"^(?:(?:FIRST|ANY)\s+)?(?:\d+\s*)?\((.*)\)$", re.IGNORECASE | re.DOTALL)
+
+    def __init__(self, mode, standby_count, max_flush_lag_bytes, hysteresis_scans):
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown synchronous replication mode '{mode}', expected one of {self.MODES}.")
+
+        self.logger = logging.getLogger("logger")
+        self.mode = mode
+        self.standby_count = standby_count
+        self.max_flush_lag_bytes = max_flush_lag_bytes
+        self.lag_step_bytes = max(max_flush_lag_bytes // 4, 1)
+        self.hysteresis_scans = hysteresis_scans
+        self.reset()
+
+    def reset(self):
+        """Forgets the state of standbys, the list is seeded again from synchronous_standby_names on the next scan."""
+        self.members = []
+        self.is_seeded = False
+        self.healthy_scans = {}
+        self.unhealthy_scans = {}
+        self.reordered_members = None
+        self.reorder_scans = 0
+        self.substitutes = []
+
+    @staticmethod
+    def parse_synchronous_standby_names(value):
+        """Returns standby names of synchronous_standby_names in their order, e.g. ['p2', 'p3'] for 'FIRST 1 ("p2", p3)'."""
+        value = (value or "").strip()
+        match = SynchronousReplicationPolicy.STANDBY_NAMES_LIST_REGEX.match(value)
+        if match:
+            value = match.group(1)
+
+        names, name, quoted = [], [], False
+        pos = 0
+        while pos < len(value):
+            c = value[pos]
+            if c == '"':
+                if quoted and value[pos + 1:pos + 2] == '"':
+                    name.append(c)
+                    pos += 1
+                else:
+                    quoted = not quoted
+            elif c == ',' and not quoted:
+                names.append("".join(name).strip())
+                name = []
+            else:
+                name.append(c)
+            pos += 1
+        names.append("".join(name).strip())
+        return [name for name in names if name]
+
+    def is_healthy(self, standby):
+        return standby["state"] == self.STREAMING_STATE and standby["flush_lag_bytes"] is not None \
+            and standby["flush_lag_bytes"] <= self.max_flush_lag_bytes
+
+    def get_lag_order_key(self, standby):
+        flush_lag_bytes = standby["flush_lag_bytes"]
+        return (1, 0) if flush_lag_bytes is None else (0, flush_lag_bytes // self.lag_step_bytes)
+
+    def seed_members(self, standbys, current_synchronous_standby_names):
+        """Takes the list of synchronous standbys from the current value of synchronous_standby_names of the master."""
+        self.is_seeded = True
+        if (current_synchronous_standby_names or "").strip() == '*':
+            names = [name for name, standby in standbys.items() if self.is_healthy(standby)]
+        else:
+            names = self.parse_synchronous_standby_names(current_synchronous_standby_names)
+
+        self.members = [name for name in names if name in standbys]
+        if self.members:
+            self.logger.info(f"Synchronous standbys are taken from the current synchronous_standby_names: {self.members}.")
+
+    def update_members(self, standbys):
+        """Updates the list of synchronous standbys using the state of standbys from pg_stat_replication."""
+        for name in list(self.members):
+            if name not in standbys:
+                self.logger.warning(f"Standby {name} is removed from synchronous standbys because it is disconnected.")
+                self.members.remove(name)
+
+        for name in list(self.healthy_scans.keys()):
+            if name not in standbys:
+                del self.healthy_scans[name]
+                self.unhealthy_scans.pop(name, None)
+
+        # the list without standbys provides no durability, so the first healthy standbys join it at once
+        is_empty = not self.members
+        for name, standby in sorted(standbys.items(), key=lambda item: self.get_lag_order_key(item[1])):
+            if self.is_healthy(standby):
+                self.healthy_scans[name] = self.healthy_scans.get(name, 0) + 1
+                self.unhealthy_scans[name] = 0
+            else:
+                self.unhealthy_scans[name] = self.unhealthy_scans.get(name, 0) + 1
+                self.healthy_scans[name] = 0
+
+            if name not in self.members and self.healthy_scans[name] > 0 and (is_empty or self.healthy_scans[name] >= self.hysteresis_scans):
+                self.logger.warning(f"Standby {name} is added to synchronous standbys, flush lag = {standby['flush_lag_bytes']} bytes.")
+                self.members.append(name)
+
+            if name in self.members and self.unhealthy_scans[name] >= self.hysteresis_scans:
+                self.logger.warning(f"Standby {name} is removed from synchronous standbys, state = {standby['state']}, "
+                                    f"flush lag = {standby['flush_lag_bytes']} bytes.")
+                self.members.remove(name)
+
+    def update_members_order(self, standbys):
+        """Orders synchronous standbys by their flush lag, a new order is applied after `hysteresis_scans` scans in a row."""
+        ordered_members = sorted(self.members, key=lambda name: self.get_lag_order_key(standbys[name]))
+        if ordered_members == self.members:
+            self.reordered_members, self.reorder_scans = None, 0
+            return
+
+        if ordered_members != self.reordered_members:
+            self.reordered_members, self.reorder_scans = ordered_members, 0
+        self.reorder_scans += 1
+        if self.reorder_scans >= self.hysteresis_scans:
+            self.logger.warning(f"Synchronous standbys are reordered by their flush lag: {ordered_members}.")
+            self.members = ordered_members
+            self.reordered_members, self.reorder_scans = None, 0
+
+    def update_substitutes(self, standbys):
+        """Chooses connected standbys which pad the list up to `standby_count`, the least lagging ones first."""
+        candidates = sorted((name for name in standbys if name not in self.members),
+                            key=lambda name: (standbys[name]["state"] != self.STREAMING_STATE, self.get_lag_order_key(standbys[name]), name))
+        substitutes = candidates[:max(self.standby_count - len(self.members), 0)]
+        if substitutes != self.substitutes:
+            if substitutes:
+                self.logger.warning(f"There are fewer healthy standbys than {self.standby_count}, synchronous standbys are padded "
+                                    f"with lagging standbys {substitutes}.")
+            self.substitutes = substitutes
+
+    def get_synchronous_standby_names(self, standbys, connected_standbys_count, current_synchronous_standby_names):
+        """Returns the value of synchronous_standby_names for the given standbys of the master DB."""
+        if self.mode == "star":
+            return '*' if connected_standbys_count > 0 else ''
+
+        if not self.is_seeded:
+            self.seed_members(standbys, current_synchronous_standby_names)
+        self.update_members(standbys)
+        if self.mode == "first":
+            self.update_members_order(standbys)
+        self.update_substitutes(standbys)
+        if not self.members and not self.substitutes:
+            return ''
+
+        # the order of standbys matters for FIRST only, ANY list is sorted so its value does not change on reordering
+        if self.mode == "first":
+            members = self.members + self.substitutes
+        else:
+            members = sorted(self.members + self.substitutes)
+
+        count = min(self.standby_count, len(members))
+        names = ", ".join('"' + name.replace('"', '""') + '"' for name in members)
+        return f"{self.mode.upper()} {count} ({names})"
@@ -1,21 +1,48 @@
 import datetime
+import json
 from http.server import HTTPServer, SimpleHTTPRequestHandler
 import logging
 from socketserver import ThreadingMixIn
-from threading import Thread
+from threading import Lock, Thread
+from urllib.parse import urlparse, parse_qs
+
+
+WATCH_DEFAULT_TIMEOUT_SEC = 30
+WATCH_MAX_TIMEOUT_SEC = 300
+WATCH_KEEPALIVE_PERIOD_SEC = 15
+WATCH_MAX_STREAMS = 100
+# idle keep-alive connections are closed after this time, so they don't hold threads of the server
+REQUEST_TIMEOUT_SEC = 60
 
 
 class ThreadedWebServer(ThreadingMixIn, HTTPServer):
+    # threads which serve /watch streams must not prevent the service from stopping
+    daemon_threads = True
     logger = None
     get_clustre_state_func = None
+    get_events_func = None
+    cluster_view = None
+    health_check = None
+    get_rebuild_progress_func = None
+    get_probes_stats_func = None
+    get_service_state_func = None
+    is_stopping = False
+    watch_streams_count = 0
+    watch_streams_lock = None
 
 
 class WebServer(Thread):
-    def __init__(self, get_clustre_state_func, address, port):
+    def __init__(self, get_clustre_state_func, get_events_func, cluster_view, health_check, get_rebuild_progress_func, get_probes_stats_func, get_service_state_func, address, port):
         Thread.__init__(self)
         self.logger = logging.getLogger("logger")
         self.server = None
         self.get_clustre_state_func = get_clustre_state_func
+        self.get_events_func = get_events_func
+        self.cluster_view = cluster_view
+        self.health_check = health_check
+        self.get_rebuild_progress_func = get_rebuild_progress_func
+        self.get_probes_stats_func = get_probes_stats_func
+        self.get_service_state_func = get_service_state_func
         self.address = address
         self.port = port
 
@@ -23,8 +50,15 @@ class WebServer(Thread):
         self.server = ThreadedWebServer((self.address, self.port), RequestHandler)
         self.server.logger = self.logger
         self.server.get_clustre_state_func = self.get_clustre_state_func
+        self.server.get_events_func = self.get_events_func
+        self.server.cluster_view = self.cluster_view
+        self.server.health_check = self.health_check
+        self.server.get_rebuild_progress_func = self.get_rebuild_progress_func
+        self.server.get_probes_stats_func = self.get_probes_stats_func
+        self.server.get_service_state_func = self.get_service_state_func
+        self.server.watch_streams_lock = Lock()
         url = "http://" + self.address + ":" + str(self.port)
-        self.logger.info(f"Starting webserver at {url}. Check {url}/status and {url}/heartbeat")
+        self.logger.info(f"Starting webserver at {url}. Check {url}/status, {url}/heartbeat, {url}/events?since=0, {url}/watch, {url}/primary, {url}/replica, {url}/rebuild and {url}/probes")
         self.server.serve_forever()
         pass
 
@@ -33,30 +67,141 @@ class WebServer(Thread):
             return
 
         self.logger.debug("Stopping webserver.")
+        self.server.is_stopping = True
         self.server.shutdown()
         self.logger.debug("Webserver has been stopped.")
 
+
 class RequestHandler(SimpleHTTPRequestHandler):
+    # keep connections alive between requests of the same client
+    protocol_version = 'HTTP/1.1'
+    timeout = REQUEST_TIMEOUT_SEC
+
+    def send_text_response(self, code, response):
+        self.send_response(code)
+        self.send_header('Content-type', 'application/json')
+        self.send_header('Content-length', len(response.encode(encoding='utf_8')))
+        self.end_headers()
+        self.wfile.write(response.encode(encoding='utf_8'))
+
     def do_GET(self):
-        if self.path == '/status':
+        url = urlparse(self.path)
+
+        if url.path == '/status':
             self.server.logger.debug("Got request: %r", self.path)
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            response = str(self.server.get_clustre_state_func())
-            self.send_header('Content-length', len(response))
-            self.end_headers()
-            self.wfile.write(response.encode(encoding='utf_8'))
-
-        if self.path == '/heartbeat':
+            self.send_text_response(200, str(self.server.get_clustre_state_func()))
+            return
+
+        if url.path == '/heartbeat':
             self.server.logger.debug("Got request: %r", self.path)
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            response = "{'state': 'ok', 'time':'" + str(datetime.datetime.now()) + "'}"
-            self.send_header('Content-length', len(response))
-            self.end_headers()
-            self.wfile.write(response.encode(encoding='utf_8'))
-
-        self.send_response(404)
+            self.send_text_response(200, "{'state': '" + self.server.get_service_state_func() + "', 'time':'" + str(datetime.datetime.now()) + "'}")
+            return
+
+        if url.path == '/events':
+            self.handle_events(parse_qs(url.query))
+            return
+
+        if url.path == '/watch':
+            self.handle_watch(parse_qs(url.query))
+            return
+
+        if url.path == '/primary':
+            ok, response = self.server.health_check.check_primary()
+            self.send_text_response(200 if ok else 503, json.dumps(response, separators=(',', ':')))
+            return
+
+        if url.path == '/replica':
+            self.handle_replica(parse_qs(url.query))
+            return
+
+        if url.path == '/rebuild':
+            self.send_text_response(200, json.dumps(self.server.get_rebuild_progress_func(), separators=(',', ':')))
+            return
+
+        if url.path == '/probes':
+            self.send_text_response(200, json.dumps(self.server.get_probes_stats_func(), separators=(',', ':')))
+            return
+
+        self.send_error(404)
+
+    def handle_events(self, query):
+        """Returns events of the journal with id greater than `since`."""
+        self.server.logger.debug("Got request: %r", self.path)
+        try:
+            since = int(query.get('since', ['0'])[-1])
+        except ValueError:
+            self.send_text_response(400, json.dumps({'error': 'since must be an event id'}))
+            return
+        self.send_text_response(200, json.dumps(self.server.get_events_func(since), separators=(',', ':')))
+
+    def handle_replica(self, query):
+        """Returns 200 if the local node is a standby whose replication lag does not exceed `max_lag_bytes`, otherwise 503."""
+        try:
+            max_lag_bytes = query.get('max_lag_bytes', [None])[-1]
+            max_lag_bytes = int(max_lag_bytes) if max_lag_bytes is not None else None
+        except ValueError:
+            self.send_text_response(400, json.dumps({'error': 'max_lag_bytes must be a number'}))
+            return
+        ok, response = self.server.health_check.check_replica(max_lag_bytes)
+        self.send_text_response(200 if ok else 503, json.dumps(response, separators=(',', ':')))
+
+    def handle_watch(self, query):
+        """Returns changes of the cluster view after the version given by `since`. Waits for changes up to `timeout`
+        seconds (long polling) or streams them as Server-Sent Events if `stream=1` or text/event-stream is accepted."""
+        try:
+            since = int(self.headers.get('Last-Event-ID') or query.get('since', ['0'])[-1])
+            timeout = min(float(query.get('timeout', [WATCH_DEFAULT_TIMEOUT_SEC])[-1]), WATCH_MAX_TIMEOUT_SEC)
+        except ValueError:
+            self.send_text_response(400, json.dumps({'error': 'since must be a version and timeout must be a number'}))
+            return
+
+        if query.get('stream', ['0'])[-1] == '1' or 'text/event-stream' in self.headers.get('Accept', ''):
+            self.stream_watch(since)
+            return
+
+        changes = self.server.cluster_view.get_changes(since) if since <= 0 \
+            else self.server.cluster_view.wait_for_changes(since, timeout)
+        if changes is None:
+            changes = {'version': since, 'full': False, 'nodes': {}}
+        self.send_text_response(200, json.dumps(changes, separators=(',', ':')))
+
+    def stream_watch(self, since):
+        """Streams changes of the cluster view as Server-Sent Events, the event id is the version of the view.
+        Each stream holds a thread of the server, so the number of streams is limited by WATCH_MAX_STREAMS."""
+        with self.server.watch_streams_lock:
+            if self.server.watch_streams_count >= WATCH_MAX_STREAMS:
+                self.send_text_response(503, json.dumps({'error': f'too many watch streams, the limit is {WATCH_MAX_STREAMS}'}))
+                return
+            self.server.watch_streams_count += 1
+
+        try:
+            self.write_watch_stream(since)
+        finally:
+            with self.server.watch_streams_lock:
+                self.server.watch_streams_count -= 1
+
+    def write_watch_stream(self, since):
+        self.server.logger.debug("Client %s is watching the cluster from version %s", self.client_address, since)
+        self.close_connection = True
+        self.send_response(200)
+        self.send_header('Content-type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+
+        changes = self.server.cluster_view.get_changes(since)
+        try:
+            while not self.server.is_stopping:
+                if changes is None:
+                    self.wfile.write(b': keepalive\n\n')
+                else:
+                    since = changes['version']
+                    data = json.dumps(changes, separators=(',', ':'))
+                    self.wfile.write(f"id: {since}\ndata: {data}\n\n".encode(encoding='utf_8'))
+                self.wfile.flush()
+                changes = self.server.cluster_view.wait_for_changes(since, WATCH_KEEPALIVE_PERIOD_SEC)
+        except (BrokenPipeError, ConnectionResetError, TimeoutError):
+            self.server.logger.debug("Client %s has stopped watching the cluster", self.client_address)
 
     def log_message(self, format, *args):
         """Function is overridden in order to fix the running of webserver as a Windows service."""
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# modules of the service are imported relative to its directory, e.g. `from utils import shell`
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
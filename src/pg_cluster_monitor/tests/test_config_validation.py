@@ -0,0 +1,36 @@
+import configparser
+
+from monitor import config_validation
+
+
+def validate_probe_sections(text):
+    config = configparser.ConfigParser()
+    config.read_string("[cluster]\np1 = host=p1\n[main]\n" + text)
+    return [error for error in config_validation.validate_config(config) if "[main]" not in error]
+
+
+def test_valid_probe():
+    assert validate_probe_sections("[probe.x]\nsql = SELECT 5 %% 2\nroles = master\ninterval_sec = 30\n") == []
+
+
+def test_single_percent_sign_is_reported():
+    errors = validate_probe_sections("[probe.x]\nsql = SELECT 5 % 2\n")
+    assert len(errors) == 1 and "[probe.x]" in errors[0]
+
+
+def test_custom_probe_without_sql():
+    assert len(validate_probe_sections("[probe.x]\nroles = master\n")) == 1
+
+
+def test_unknown_role():
+    assert len(validate_probe_sections("[probe.db_size]\nroles = replica\n")) == 1
+
+
+def test_role_probe_settings_are_fixed():
+    assert len(validate_probe_sections("[probe.db_role]\nroles = master\ninterval_sec = 30\ntimeout_ms = 1000\n")) == 2
+
+
+def test_single_percent_sign_in_connection_string_is_reported():
+    config = configparser.ConfigParser()
+    config.read_string("[cluster]\np1 = host=p1 password=a%b\n")
+    assert any("[cluster]" in error for error in config_validation.validate_config(config))
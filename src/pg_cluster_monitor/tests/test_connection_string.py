@@ -0,0 +1,102 @@
+import pytest
+
+from utils import shell
+
+
+@pytest.fixture(autouse=True)
+def no_service_files(monkeypatch, tmp_path):
+    monkeypatch.setenv("PGSERVICEFILE", str(tmp_path / "pg_service.conf"))
+    monkeypatch.delenv("PGSYSCONFDIR", raising=False)
+    shell._parse_postgre_sql_connection_string_cached.cache_clear()
+    yield
+    shell._parse_postgre_sql_connection_string_cached.cache_clear()
+
+
+def parse(connection_string):
+    return dict(shell.parse_postgre_sql_connection_string(connection_string))
+
+
+def test_key_value():
+    assert parse("host=p1 port=5433 dbname=test user=postgres") == \
+        {"host": "p1", "port": "5433", "dbname": "test", "user": "postgres"}
+
+
+def test_key_value_with_spaces_around_equal_sign():
+    assert parse("  host = p1   port= 5433 ") == {"host": "p1", "port": "5433"}
+
+
+def test_key_value_quoted_and_escaped():
+    assert parse("password='a b\\'c' application_name=x\\ y dbname=''") == \
+        {"password": "a b'c", "application_name": "x y", "dbname": ""}
+
+
+def test_key_value_unterminated_quote():
+    with pytest.raises(ValueError):
+        parse("password='abc")
+
+
+def test_key_value_without_value():
+    with pytest.raises(ValueError):
+        parse("host p1")
+
+
+def test_url():
+    assert parse("postgresql://user:secret@p1:5433/test?sslmode=require") == \
+        {"user": "user", "password": "secret", "host": "p1", "port": "5433", "dbname": "test", "sslmode": "require"}
+
+
+def test_url_with_percent_encoding():
+    assert parse("postgres://us%40er:p%3Ass@p1/my%20db") == \
+        {"user": "us@er", "password": "p:ss", "host": "p1", "dbname": "my db"}
+
+
+def test_url_multiple_hosts():
+    assert parse("postgresql://p1:5432,p2:5433/test") == {"host": "p1,p2", "port": "5432,5433", "dbname": "test"}
+
+
+def test_url_ipv6():
+    assert parse("postgresql://[::1]:5433/test") == {"host": "::1", "port": "5433", "dbname": "test"}
+
+
+def test_url_query_without_path():
+    assert parse("postgresql://p1?dbname=test&ssl=true") == {"host": "p1", "dbname": "test", "sslmode": "require"}
+
+
+def test_url_without_host():
+    assert parse("postgresql:///test") == {"dbname": "test"}
+
+
+def test_url_invalid_query():
+    with pytest.raises(ValueError):
+        parse("postgresql://p1/test?sslmode")
+
+
+def test_service(tmp_path):
+    (tmp_path / "pg_service.conf").write_text("[main]\nhost=p1\nport=5433\ndbname=test\n", encoding="utf-8")
+    assert parse("service=main dbname=other") == {"host": "p1", "port": "5433", "dbname": "other", "service": "main"}
+
+
+def test_unknown_service_keeps_fields():
+    assert parse("service=absent host=p2") == {"service": "absent", "host": "p2"}
+
+
+def test_result_is_read_only():
+    with pytest.raises(TypeError):
+        shell.parse_postgre_sql_connection_string("host=p1")["host"] = "p2"
+
+
+@pytest.mark.parametrize("connection_string, expected", [
+    ("host=p1", [("p1", "5432")]),
+    ("host=P1 port=5432", [("p1", "5432")]),
+    ("host=p1 port=5433", [("p1", "5433")]),
+    ("host=p1,p2 port=6000", [("p1", "6000"), ("p2", "6000")]),
+    ("postgresql://p1:5433,p2/test", [("p1", "5433"), ("p2", "5432")]),
+])
+def test_get_hosts_and_ports(connection_string, expected):
+    assert shell.get_postgre_sql_hosts_and_ports(shell.parse_postgre_sql_connection_string(connection_string)) == expected
+
+
+def test_hosts_differ_by_port():
+    first = shell.parse_postgre_sql_connection_string("host=p1 port=5432")
+    second = shell.parse_postgre_sql_connection_string("host=p1 port=5433")
+    assert shell.get_postgre_sql_hosts_and_ports(first) != shell.get_postgre_sql_hosts_and_ports(second)
@@ -0,0 +1,50 @@
+import configparser
+
+import pytest
+
+from cluster import probes
+from cluster.probes import ProbeRegistry, ProbeStats
+
+
+def stats_with_avg_duration(avg_duration_ms):
+    stats = ProbeStats()
+    stats.add_run(0, avg_duration_ms, [])
+    return stats
+
+
+def builtin_probe(name):
+    return next(probe for probe in probes.get_builtin_probes() if probe.name == name)
+
+
+@pytest.mark.parametrize("name", ["db_time", "db_size", "pg_wal_size", "pg_wal_files_count"])
+def test_status_probes_are_throttled(name):
+    registry = ProbeRegistry([], max_duration_percent=1, scan_period_sec=5)
+    assert registry.get_throttled_interval_sec(builtin_probe(name), stats_with_avg_duration(10000)) == 1000
+
+
+@pytest.mark.parametrize("name", ["db_role", "wal_position", "replication_position", "synchronous_standby_names",
+                                  "primary_conn_info", "primary_slot_name", "replication_slots", "replication_standbys"])
+def test_decision_probes_are_not_throttled(name):
+    registry = ProbeRegistry([], max_duration_percent=1, scan_period_sec=5)
+    assert registry.get_throttled_interval_sec(builtin_probe(name), stats_with_avg_duration(10000)) is None
+
+
+def test_cheap_probe_is_not_throttled():
+    registry = ProbeRegistry([], max_duration_percent=1, scan_period_sec=5)
+    assert registry.get_throttled_interval_sec(builtin_probe("db_time"), stats_with_avg_duration(10)) is None
+
+
+def test_custom_probe_is_throttled():
+    config = configparser.ConfigParser()
+    config.read_string("[probe.long_transactions]\nsql = SELECT 1\ninterval_sec = 30\n")
+    probe = probes.read_config_probes(config, [])[0]
+    registry = ProbeRegistry([probe], max_duration_percent=1, scan_period_sec=5)
+    assert registry.get_throttled_interval_sec(probe, stats_with_avg_duration(1000)) == 100
+
+
+@pytest.mark.parametrize("key", ["roles", "interval_sec"])
+def test_role_probe_settings_are_fixed(key):
+    config = configparser.ConfigParser()
+    config.read_string(f"[probe.db_role]\n{key} = 1\n")
+    with pytest.raises(ValueError):
+        probes.read_config_probes(config, probes.get_builtin_probes())
@@ -0,0 +1,130 @@
+import pytest
+
+from monitor.synchronous_replication_policy import SynchronousReplicationPolicy
+
+MAX_FLUSH_LAG_BYTES = 1000
+HYSTERESIS_SCANS = 3
+
+
+def standby(flush_lag_bytes, state="streaming"):
+    return {"state": state, "flush_lag_bytes": flush_lag_bytes}
+
+
+def create_policy(mode="first", standby_count=1):
+    return SynchronousReplicationPolicy(mode, standby_count, MAX_FLUSH_LAG_BYTES, HYSTERESIS_SCANS)
+
+
+def scan(policy, standbys, current=""):
+    return policy.get_synchronous_standby_names(standbys, len(standbys), current)
+
+
+def test_unknown_mode():
+    with pytest.raises(ValueError):
+        create_policy("sync")
+
+
+def test_star():
+    policy = create_policy("star")
+    assert scan(policy, {"n2": standby(0)}) == "*"
+    assert scan(policy, {}) == ""
+
+
+@pytest.mark.parametrize("value, expected", [
+    ('', []),
+    ('*', ['*']),
+    ('n2, n3', ['n2', 'n3']),
+    ('2 (n2, n3)', ['n2', 'n3']),
+    ('FIRST 1 ("n2", n3)', ['n2', 'n3']),
+    ('any 2 ("a,""b", c)', ['a,"b', 'c']),
+])
+def test_parse_synchronous_standby_names(value, expected):
+    assert SynchronousReplicationPolicy.parse_synchronous_standby_names(value) == expected
+
+
+def test_empty_list_is_filled_at_once():
+    policy = create_policy()
+    assert scan(policy, {"n2": standby(0)}) == 'FIRST 1 ("n2")'
+
+
+def test_standby_joins_non_empty_list_after_hysteresis():
+    policy = create_policy()
+    scan(policy, {"n2": standby(0)})
+    standbys = {"n2": standby(0), "n3": standby(0)}
+    for _ in range(HYSTERESIS_SCANS - 1):
+        assert scan(policy, standbys) == 'FIRST 1 ("n2")'
+    assert scan(policy, standbys) == 'FIRST 1 ("n2", "n3")'
+
+
+def test_lagging_standby_leaves_list_after_hysteresis():
+    policy = create_policy()
+    standbys = {"n2": standby(0), "n3": standby(MAX_FLUSH_LAG_BYTES + 1)}
+    for _ in range(HYSTERESIS_SCANS - 1):
+        assert scan(policy, standbys, 'FIRST 1 ("n2", "n3")') == 'FIRST 1 ("n2", "n3")'
+    assert scan(policy, standbys, 'FIRST 1 ("n2", "n3")') == 'FIRST 1 ("n2")'
+
+
+def test_disconnected_standby_leaves_list_at_once():
+    policy = create_policy()
+    assert scan(policy, {"n2": standby(0), "n3": standby(0)}, 'FIRST 1 ("n2", "n3")') == 'FIRST 1 ("n2", "n3")'
+    assert scan(policy, {"n3": standby(0)}) == 'FIRST 1 ("n3")'
+
+
+def test_list_is_seeded_from_current_value():
+    policy = create_policy()
+    assert scan(policy, {"n2": standby(0), "n3": standby(0)}, 'FIRST 1 ("n3", "n2")') == 'FIRST 1 ("n3", "n2")'
+
+
+def test_seeding_skips_disconnected_standbys():
+    policy = create_policy()
+    assert scan(policy, {"n3": standby(0)}, 'FIRST 1 ("n2", "n3")') == 'FIRST 1 ("n3")'
+
+
+def test_list_is_seeded_from_star():
+    policy = create_policy("any")
+    assert scan(policy, {"n2": standby(0), "n3": standby(0)}, '*') == 'ANY 1 ("n2", "n3")'
+
+
+def test_reset_seeds_list_again():
+    policy = create_policy()
+    scan(policy, {"n2": standby(0), "n3": standby(0)}, 'FIRST 1 ("n3", "n2")')
+    policy.reset()
+    assert scan(policy, {"n2": standby(0), "n3": standby(0)}, 'FIRST 1 ("n2")') == 'FIRST 1 ("n2")'
+
+
+def test_first_is_reordered_by_lag_after_hysteresis():
+    policy = create_policy()
+    standbys = {"n2": standby(0), "n3": standby(MAX_FLUSH_LAG_BYTES)}
+    scan(policy, {"n2": standby(0), "n3": standby(0)}, 'FIRST 1 ("n3", "n2")')
+    for _ in range(HYSTERESIS_SCANS - 1):
+        assert scan(policy, standbys) == 'FIRST 1 ("n3", "n2")'
+    assert scan(policy, standbys) == 'FIRST 1 ("n2", "n3")'
+
+
+def test_first_is_not_reordered_by_small_lag_difference():
+    policy = create_policy()
+    scan(policy, {"n2": standby(0), "n3": standby(0)}, 'FIRST 1 ("n3", "n2")')
+    standbys = {"n2": standby(0), "n3": standby(MAX_FLUSH_LAG_BYTES // 8)}
+    for _ in range(HYSTERESIS_SCANS * 2):
+        assert scan(policy, standbys) == 'FIRST 1 ("n3", "n2")'
+
+
+def test_any_list_is_sorted_by_name():
+    policy = create_policy("any", 2)
+    assert scan(policy, {"n3": standby(0), "n2": standby(MAX_FLUSH_LAG_BYTES)}) == 'ANY 2 ("n2", "n3")'
+
+
+def test_list_is_padded_with_least_lagging_standbys():
+    policy = create_policy("first", 2)
+    standbys = {"n2": standby(0), "n3": standby(MAX_FLUSH_LAG_BYTES * 3), "n4": standby(MAX_FLUSH_LAG_BYTES * 2)}
+    assert scan(policy, standbys) == 'FIRST 2 ("n2", "n4")'
+
+
+def test_all_lagging_standbys_keep_count():
+    policy = create_policy("any")
+    standbys = {"n2": standby(MAX_FLUSH_LAG_BYTES * 2), "n3": standby(None, "catchup")}
+    assert scan(policy, standbys) == 'ANY 1 ("n2")'
+
+
+def test_count_is_decreased_to_connected_standbys():
+    policy = create_policy("first", 3)
+    assert scan(policy, {"n2": standby(0), "n3": standby(MAX_FLUSH_LAG_BYTES * 2)}) == 'FIRST 2 ("n2", "n3")'
@@ -1,5 +1,34 @@
 import logging
-import psycopg2
+
+DEFAULT_CONNECT_TIMEOUT_SEC = 5
+
+_connect_timeout_sec = DEFAULT_CONNECT_TIMEOUT_SEC
+
+
+def set_connect_timeout(connect_timeout_sec):
+    """Sets connect_timeout which is used for connection strings without their own one."""
+    global _connect_timeout_sec
+    _connect_timeout_sec = connect_timeout_sec
+
+
+def connect(connection_string):
+    """Connects to the DB, psycopg2 is imported on the first connection to speed up the start of the service.
+    The time of connection is bounded, so an unreachable node does not hang the scan for the OS TCP timeout."""
+    import psycopg2
+    if "connect_timeout" in connection_string or _connect_timeout_sec <= 0:
+        return psycopg2.connect(dsn=connection_string)
+    return psycopg2.connect(dsn=connection_string, connect_timeout=_connect_timeout_sec)
+
+
+def fetch_all_with_timeout(conn, sql, timeout_ms):
+    """Executes SQL on the open connection with the given statement_timeout and returns all rows.
+    The timeout is sent with the query, so it costs no extra round trip."""
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"SET statement_timeout = {int(timeout_ms)}; {sql}")
+        return cursor.fetchall()
+    finally:
+        cursor.close()
 
 
 def try_fetch_one(connection_string, sql):
@@ -7,7 +36,7 @@ def try_fetch_one(connection_string, sql):
     conn = None
     res, err = None, True
     try:
-        conn = psycopg2.connect(dsn=connection_string)
+        conn = connect(connection_string)
         cursor = conn.cursor()
         cursor.execute(sql)
         data = cursor.fetchone()
@@ -23,12 +52,52 @@ def try_fetch_one(connection_string, sql):
     return res, err
 
 
+def try_fetch_row(connection_string, sql):
+    """Executes SQL and returns the first row as a tuple if it exists, otherwise returns None."""
+    conn = None
+    res, err = None, True
+    try:
+        conn = connect(connection_string)
+        cursor = conn.cursor()
+        cursor.execute(sql)
+        res = cursor.fetchone()
+        err = False
+        cursor.close()
+        return res, err
+    except Exception as ex:
+        logging.getLogger("logger").error(f"Cannot execute {sql}: {ex}")
+    finally:
+        if conn is not None:
+            conn.close()
+    return res, err
+
+
+def try_fetch_all(connection_string, sql):
+    """Executes SQL and returns all rows as a list of tuples."""
+    conn = None
+    res, err = [], True
+    try:
+        conn = connect(connection_string)
+        cursor = conn.cursor()
+        cursor.execute(sql)
+        res = cursor.fetchall()
+        err = False
+        cursor.close()
+        return res, err
+    except Exception as ex:
+        logging.getLogger("logger").error(f"Cannot execute {sql}: {ex}")
+    finally:
+        if conn is not None:
+            conn.close()
+    return res, err
+
+
 def execute(connection_string, sql):
     """Executes SQL."""
     conn = None
     res = False
     try:
-        conn = psycopg2.connect(dsn=connection_string)
+        conn = connect(connection_string)
         cursor = conn.cursor()
         cursor.execute(sql)
         conn.commit()
@@ -47,11 +116,11 @@ def alter_postgre_sql_config(connection_string, config_name, val):
     conn = None
     sql = ''
     try:
-        conn = psycopg2.connect(dsn=connection_string)
+        conn = connect(connection_string)
         conn.set_isolation_level(0)
 
         cursor = conn.cursor()
-        sql = 'ALTER SYSTEM SET ' + config_name + ' TO \'' + val + '\''
+        sql = 'ALTER SYSTEM SET ' + config_name + ' TO \'' + val.replace('\'', '\'\'') + '\''
         logging.getLogger("logger").debug(f"Execute: {sql}")
         cursor.execute(sql)
         conn.commit()
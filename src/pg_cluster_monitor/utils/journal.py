@@ -0,0 +1,166 @@
+import atexit
+import collections
+import datetime
+import json
+import logging
+import os
+import queue
+from threading import Lock, Thread
+from utils import shell
+
+DEFAULT_MAX_BYTES = 10485760
+DEFAULT_BACKUP_COUNT = 5
+MAX_EVENTS_IN_MEMORY = 10000
+
+_journal = None
+
+
+class EventJournal:
+    """Append-only journal of important cluster events, such as role changes, master loss or promotion.
+    Each event is written as a compact JSON line; the file is rotated like RotatingFileHandler does.
+    The latest events are kept in memory and indexed by a sequential event id. Lines are written to the file
+    by a background thread, so a slow disk does not block the cluster scan."""
+
+    _sentinel = None
+
+    def __init__(self, filename, max_bytes, backup_count):
+        self.logger = logging.getLogger("logger")
+        self.filename = filename
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.events = collections.deque(maxlen=MAX_EVENTS_IN_MEMORY)
+        self.last_event_id = 0
+        self.lock = Lock()
+        self.stream = None
+        self.lines_queue = queue.Queue()
+
+        self.load()
+        self.stream = open(self.filename, mode="a", encoding="utf-8")
+        self.writer = Thread(target=self.write_lines, name="EventJournalWriter", daemon=True)
+        self.writer.start()
+
+    def get_backup_filename(self, index):
+        return f"{self.filename}.{index}" if index > 0 else self.filename
+
+    def load(self):
+        """Reads the latest events from the journal files in order to continue event ids after restart."""
+        loaded = []
+        for index in range(0, self.backup_count + 1):
+            filename = self.get_backup_filename(index)
+            if not os.path.exists(filename):
+                break
+
+            events_of_file = []
+            with open(filename, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        events_of_file.append(json.loads(line))
+                    except ValueError:
+                        self.logger.warning(f"Skip broken line in the events journal {filename}: {line!r}")
+            loaded = events_of_file + loaded
+
+            if len(loaded) >= MAX_EVENTS_IN_MEMORY:
+                break
+
+        self.events.extend(loaded[-MAX_EVENTS_IN_MEMORY:])
+        if self.events:
+            self.last_event_id = self.events[-1]["id"]
+
+    def rotate(self):
+        """Shifts journal files the same way as RotatingFileHandler does."""
+        self.stream.close()
+        for index in range(self.backup_count - 1, 0, -1):
+            source = self.get_backup_filename(index)
+            if os.path.exists(source):
+                os.replace(source, self.get_backup_filename(index + 1))
+        if self.backup_count > 0:
+            os.replace(self.filename, self.get_backup_filename(1))
+        else:
+            os.remove(self.filename)
+        self.stream = open(self.filename, mode="a", encoding="utf-8")
+
+    def write(self, event_type, attrs):
+        """Appends event to the in-memory index, queues it for writing to the file and returns its id."""
+        with self.lock:
+            self.last_event_id += 1
+            event = {"id": self.last_event_id, "ts": datetime.datetime.now().isoformat(timespec="milliseconds"), "type": event_type}
+            event.update(attrs)
+            line = json.dumps(event, separators=(",", ":"), default=str) + "\n"
+
+            self.events.append(event)
+            self.lines_queue.put(line)
+            return self.last_event_id
+
+    def write_lines(self):
+        """Writes queued lines to the file until the sentinel is received, runs in the writer thread."""
+        while True:
+            line = self.lines_queue.get()
+            if line is self._sentinel:
+                return
+
+            try:
+                if self.max_bytes > 0 and self.stream.tell() + len(line) > self.max_bytes:
+                    self.rotate()
+                self.stream.write(line)
+                if self.lines_queue.empty():
+                    self.stream.flush()
+            except Exception as ex:
+                self.logger.error(f"Cannot write event to the events journal {self.filename}: {ex}")
+
+    def get_events(self, since=0):
+        """Returns events with id greater than the given one."""
+        with self.lock:
+            if not self.events:
+                return []
+
+            first_event_id = self.events[0]["id"]
+            if self.events[-1]["id"] - first_event_id + 1 != len(self.events):
+                # ids are not contiguous if the journal file had broken lines
+                return [e for e in self.events if e["id"] > since]
+
+            start = max(since - first_event_id + 1, 0)
+            return [self.events[i] for i in range(start, len(self.events))]
+
+    def close(self):
+        """Writes queued events and closes the file."""
+        if self.writer is not None:
+            self.lines_queue.put(self._sentinel)
+            self.writer.join()
+            self.writer = None
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+
+
+def init_journal(config=None):
+    """Opens the events journal in the application directory."""
+    global _journal
+
+    config_section = config["main"] if config is not None and config.has_section("main") else None
+    max_bytes = DEFAULT_MAX_BYTES
+    backup_count = DEFAULT_BACKUP_COUNT
+    if config_section is not None:
+        max_bytes = config_section.getint("events_journal_max_bytes", DEFAULT_MAX_BYTES)
+        backup_count = config_section.getint("events_journal_backup_count", DEFAULT_BACKUP_COUNT)
+
+    filename = os.path.join(shell.get_app_directory(), "events.jsonl")
+    print(f"Path to events journal = {filename}")
+
+    if _journal is not None:
+        _journal.close()
+    _journal = EventJournal(filename, max_bytes, backup_count)
+    atexit.register(_journal.close)
+
+
+def write_event(event_type, **attrs):
+    """Writes event to the journal. Does nothing if the journal is not initialized."""
+    if _journal is None:
+        return None
+    return _journal.write(event_type, attrs)
+
+
+def get_events(since=0):
+    """Returns events with id greater than `since`."""
+    if _journal is None:
+        return []
+    return _journal.get_events(since)
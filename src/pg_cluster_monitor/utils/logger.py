@@ -1,24 +1,141 @@
-import coloredlogs, logging
+import logging
 import logging.handlers
+import atexit
 import os
+import queue
+import time
 from utils import shell
 
+LOG_FMT = "%(asctime)s %(levelname)s: %(message)s"
+DEFAULT_LEVEL = "DEBUG"
+DEFAULT_QUEUE_MAX_SIZE = 10000
+DROPPED_RECORDS_REPORT_PERIOD_SEC = 60
 
-def init_logging():
-    """Set up settings of logging - level, format, filename, etc."""
+_listener = None
 
-    log_fmt = "%(asctime)s %(levelname)s: %(message)s"
+
+class BoundedQueueHandler(logging.handlers.QueueHandler):
+    """Puts log records into a bounded queue without blocking the caller. Records are dropped when the queue is full."""
+
+    def __init__(self, log_queue):
+        logging.handlers.QueueHandler.__init__(self, log_queue)
+        self.dropped_records_count = 0
+        self.reported_dropped_records_count = 0
+        self.last_report_time = None
+
+    def prepare(self, record):
+        """Merges the message with its arguments in the caller thread, so the record does not depend on the state of
+        objects which can be changed after logging. Formatting of time, level and traceback is done by the writer thread."""
+        if record.args:
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped_records_count += 1
+            return
+        self.report_dropped_records()
+
+    def report_dropped_records(self):
+        """Puts a warning with the number of dropped records into the queue, not more often than once per period."""
+        if self.dropped_records_count == self.reported_dropped_records_count:
+            return
+
+        now = time.monotonic()
+        if self.last_report_time is not None and now - self.last_report_time < DROPPED_RECORDS_REPORT_PERIOD_SEC:
+            return
+
+        dropped_records_count = self.dropped_records_count - self.reported_dropped_records_count
+        record = logging.LogRecord("logger", logging.WARNING, __file__, 0,
+                                   f"{dropped_records_count} log records have been dropped because the logging queue is full, "
+                                   f"{self.dropped_records_count} records in total.", None, None)
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            return
+        self.reported_dropped_records_count = self.dropped_records_count
+        self.last_report_time = now
+
+
+class DrainingQueueListener(logging.handlers.QueueListener):
+    """Waits for free space in the bounded queue to put the stop sentinel, so stopping does not fail
+    when the queue is full and queued records are written before exit."""
+
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)
+
+
+def _get_level(config_section, key):
+    """Returns logging level defined in config section by the key, e.g. `DEBUG` or `WARNING`."""
+    level_name = DEFAULT_LEVEL
+    if config_section is not None:
+        level_name = config_section.get(key, DEFAULT_LEVEL)
+
+    level = logging.getLevelName(level_name.strip().upper())
+    if not isinstance(level, int):
+        raise ValueError(f"Unknown logging level '{level_name}' for '{key}'.")
+    return level
+
+
+def get_console_formatter():
+    """Returns colored formatter if coloredlogs is installed, it is imported here to speed up the start of the service."""
+    try:
+        import coloredlogs
+    except ImportError:
+        return logging.Formatter(LOG_FMT)
 
     level_styles = coloredlogs.DEFAULT_LEVEL_STYLES
     level_styles['debug']['color'] = ''
-    coloredlogs.install(level='DEBUG', fmt=log_fmt, level_styles=level_styles)
+    return coloredlogs.ColoredFormatter(fmt=LOG_FMT, level_styles=level_styles)
+
+
+def init_logging(config=None):
+    """Set up settings of logging - level, format, filename, etc. Records are passed through a bounded queue
+    to a background thread which writes them to console and file, so slow I/O does not block cluster scanning."""
+    global _listener
+
+    config_section = config["main"] if config is not None and config.has_section("main") else None
+    console_level = _get_level(config_section, "log_console_level")
+    file_level = _get_level(config_section, "log_file_level")
+    queue_max_size = DEFAULT_QUEUE_MAX_SIZE
+    if config_section is not None:
+        queue_max_size = config_section.getint("log_queue_max_size", DEFAULT_QUEUE_MAX_SIZE)
 
-    logging.basicConfig(format=log_fmt, level=logging.DEBUG)
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(get_console_formatter())
+    console_handler.setLevel(console_level)
 
     log_filename = os.path.join(shell.get_app_directory(), "log.log")
     print(f"Path to log file = {log_filename}")
 
-    log_handler = logging.handlers.RotatingFileHandler(filename=log_filename, mode="a", maxBytes=104857600, backupCount=10)
-    log_handler.setFormatter(logging.Formatter(log_fmt))
+    file_handler = logging.handlers.RotatingFileHandler(filename=log_filename, mode="a", maxBytes=104857600, backupCount=10)
+    file_handler.setFormatter(logging.Formatter(LOG_FMT))
+    file_handler.setLevel(file_level)
+
+    stop_logging()
+    log_queue = queue.Queue(maxsize=queue_max_size)
+    _listener = DrainingQueueListener(log_queue, console_handler, file_handler, respect_handler_level=True)
+    _listener.start()
+
+    # records below the lowest sink level are rejected by the logger itself, so their arguments are never formatted
+    root_logger = logging.getLogger()
+    for handler in root_logger.handlers[:]:
+        root_logger.removeHandler(handler)
+    root_logger.addHandler(BoundedQueueHandler(log_queue))
+    root_logger.setLevel(min(console_level, file_level))
+
+    atexit.register(stop_logging)
+
+
+def stop_logging():
+    """Flushes queued records and stops the background writer thread."""
+    global _listener
+
+    if _listener is None:
+        return
 
-    logging.getLogger("logger").addHandler(log_handler)
+    _listener.stop()
+    _listener = None
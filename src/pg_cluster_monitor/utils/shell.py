@@ -3,11 +3,14 @@ import logging.handlers
 import subprocess
 import os
 import sys
-import time
-import json
-from urllib.parse import urlparse, parse_qs
+import functools
+from types import MappingProxyType
+from urllib.parse import unquote
 import configparser
 
+DEFAULT_POSTGRE_SQL_PORT = "5432"
+
+
 def execute_cmd(cmd):
     """Executes and logs external command, returns the result of execution."""
     logger = logging.getLogger("logger")
@@ -17,72 +20,211 @@ def execute_cmd(cmd):
     return output
 
 
+def execute_cmd_with_progress(cmd, progress_callback, progress_period_sec):
+    """Executes and logs external command like execute_cmd does, but calls progress_callback
+    every progress_period_sec seconds while the command is running."""
+    logger = logging.getLogger("logger")
+    logger.debug(f"Execution cmd: {cmd}")
+    process = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+    while True:
+        try:
+            output, _ = process.communicate(timeout=progress_period_sec)
+            break
+        except subprocess.TimeoutExpired:
+            progress_callback()
+
+    # the same as subprocess.getoutput does
+    if output.endswith("\n"):
+        output = output[:-1]
+    logger.debug(f"Result: {output}")
+    return output
+
+
 def parse_postgre_sql_connection_string(connection_string):
-    """Parse PostgreSQL connection string for the given format - string or url."""
+    """Parse PostgreSQL connection string for the given format - string or url.
+    Returns a read-only mapping; results for strings are cached, so repeated parsing of the same string is cheap."""
     if isinstance(connection_string, dict):
-        return connection_string.copy()
+        return MappingProxyType(connection_string.copy())
+    return _parse_postgre_sql_connection_string_cached(connection_string)
+
+
+@functools.lru_cache(maxsize=128)
+def _parse_postgre_sql_connection_string_cached(connection_string):
+    connection_string = connection_string.strip()
     if connection_string.startswith("postgres://") or connection_string.startswith("postgresql://"):
-        return parse_postgre_sql_connection_string_as_url(connection_string)
-    return parse_postgre_sql_connection_string_as_string(connection_string)
+        fields = parse_postgre_sql_connection_string_as_url(connection_string)
+    else:
+        fields = parse_postgre_sql_connection_string_as_string(connection_string)
+
+    if "service" in fields:
+        try:
+            service_fields = read_postgre_sql_service(fields["service"])
+        except (ValueError, OSError, configparser.Error) as ex:
+            # the result is cached, so the warning is logged once per connection string
+            logging.getLogger("logger").warning(f"Cannot resolve service of connection string, its fields are used as is: {ex}")
+            service_fields = {}
+        service_fields.update(fields)
+        fields = service_fields
+
+    return MappingProxyType(fields)
+
+
+def get_postgre_sql_hosts_and_ports(fields):
+    """Returns the list of (host, port) pairs of parsed connection string fields. Hosts and ports are comma-separated
+    lists as libpq accepts them, a single port is used for all hosts, an empty port means the default port 5432."""
+    hosts = [host.strip().lower() for host in fields.get("host", "").split(",")]
+    ports = [port.strip() for port in fields.get("port", "").split(",")]
+    if len(ports) == 1:
+        ports = ports * len(hosts)
+    return [(host, port or DEFAULT_POSTGRE_SQL_PORT) for host, port in zip(hosts, ports)]
 
 
 def parse_postgre_sql_connection_string_as_url(url):
     """Parse a PostgreSQL connection string as URL to a dictionary in accordance
-    with http://www.postgresql.org/docs/current/static/libpq-connect.html#LIBPQ-CONNSTRING"""
-    schemaless_url = url.split(":", 1)[1]
-    p = urlparse(schemaless_url)
+    with http://www.postgresql.org/docs/current/static/libpq-connect.html#LIBPQ-CONNSTRING
+    Several hosts like postgresql://host1:123,host2:456/dbname are joined to `host` and `port` fields by comma as libpq does."""
+    schemaless_url = url.split("://", 1)[1]
     fields = {}
-    if p.host_name:
-        fields["host"] = p.host_name
-    if p.port:
-        fields["port"] = str(p.port)
-    if p.username:
-        fields["user"] = p.username
-    if p.password is not None:
-        fields["password"] = p.password
-    if p.path and p.path != "/":
-        fields["dbname"] = p.path[1:]
-    for k, v in parse_qs(p.query).items():
-        fields[k] = v[-1]
+
+    netloc, _, rest = schemaless_url.partition("/")
+    if "?" in netloc:
+        netloc, _, query = netloc.partition("?")
+        path = ""
+    else:
+        path, _, query = rest.partition("?")
+
+    if "@" in netloc:
+        user_info, _, netloc = netloc.rpartition("@")
+        user, has_password, password = user_info.partition(":")
+        if user:
+            fields["user"] = unquote(user)
+        if has_password:
+            fields["password"] = unquote(password)
+
+    _parse_url_hosts(netloc, fields)
+
+    if path:
+        fields["dbname"] = unquote(path)
+
+    _parse_url_query(query, fields)
     return fields
 
 
+def _parse_url_hosts(netloc, fields):
+    """Parses comma-separated `host[:port]` list of URL, IPv6 addresses are enclosed in square brackets."""
+    hosts, ports = [], []
+    for host_and_port in netloc.split(","):
+        if host_and_port.startswith("["):
+            host, _, port = host_and_port[1:].partition("]")
+            port = port[1:] if port.startswith(":") else ""
+        else:
+            host, _, port = host_and_port.partition(":")
+        hosts.append(unquote(host))
+        ports.append(port)
+    if any(hosts):
+        fields["host"] = ",".join(hosts)
+    if any(ports):
+        fields["port"] = ",".join(ports)
+
+
+def _parse_url_query(query, fields):
+    """Parses `key=value&...` parameters of URL."""
+    for param in query.split("&"):
+        if not param:
+            continue
+        if "=" not in param:
+            raise ValueError("Expect key=value format in connection URI parameter {!r}".format(param))
+        key, value = param.split("=", 1)
+        key, value = unquote(key), unquote(value)
+        # libpq accepts JDBC-like ssl=true for compatibility
+        if key == "ssl" and value == "true":
+            key, value = "sslmode", "require"
+        fields[key] = value
+
+
+def _read_connection_string_value(connection_string, pos):
+    """Reads a value of keyword/value connection string starting at the given position.
+    Returns the value and the position after it."""
+    length = len(connection_string)
+    quoted = pos < length and connection_string[pos] == "'"
+    if quoted:
+        pos += 1
+
+    chars = []
+    while pos < length:
+        c = connection_string[pos]
+        if quoted and c == "'":
+            return "".join(chars), pos + 1
+        if not quoted and c.isspace():
+            break
+        if c == "\\" and pos + 1 < length:
+            pos += 1
+            c = connection_string[pos]
+        chars.append(c)
+        pos += 1
+
+    if quoted:
+        raise ValueError("Unterminated quoted string in connection string {!r}".format(connection_string))
+    return "".join(chars), pos
+
+
 def parse_postgre_sql_connection_string_as_string(connection_string):
     """Parse a PostgreSQL connection string to a dictionary in accordance with
     http://www.postgresql.org/docs/current/static/libpq-connect.html#LIBPQ-CONNSTRING"""
     fields = {}
+    pos, length = 0, len(connection_string)
     while True:
-        connection_string = connection_string.strip()
-        if not connection_string:
+        while pos < length and connection_string[pos].isspace():
+            pos += 1
+        if pos >= length:
             break
-        if "=" not in connection_string:
-            raise ValueError("Expect key=value format in connection string fragment {!r}".format(connection_string))
-        key, rem = connection_string.split("=", 1)
-        if rem.startswith("'"):
-            as_is, value = False, ""
-            for i in range(1, len(rem)):
-                if as_is:
-                    value += rem[i]
-                    as_is = False
-                elif rem[i] == "'":
-                    break
-                elif rem[i] == "\\":
-                    as_is = True
-                else:
-                    value += rem[i]
-            else:
-                raise ValueError("Invalid connection string fragment {!r}".format(rem))
-            connection_string = rem[i + 1:]
-        else:
-            res = rem.split(None, 1)
-            if len(res) > 1:
-                value, connection_string = res
-            else:
-                value, connection_string = rem, ""
-        fields[key] = value
+
+        key_start = pos
+        while pos < length and connection_string[pos] != "=" and not connection_string[pos].isspace():
+            pos += 1
+        key = connection_string[key_start:pos]
+
+        while pos < length and connection_string[pos].isspace():
+            pos += 1
+        if pos >= length or connection_string[pos] != "=":
+            raise ValueError("Expect key=value format in connection string fragment {!r}".format(connection_string[key_start:]))
+        pos += 1
+        while pos < length and connection_string[pos].isspace():
+            pos += 1
+
+        fields[key], pos = _read_connection_string_value(connection_string, pos)
     return fields
 
 
+def get_postgre_sql_service_files():
+    """Returns paths to connection service files in the order libpq looks them up."""
+    files = []
+    if os.environ.get("PGSERVICEFILE"):
+        files.append(os.environ["PGSERVICEFILE"])
+    elif os.name == "nt":
+        files.append(os.path.join(os.environ.get("APPDATA", ""), "postgresql", ".pg_service.conf"))
+    else:
+        files.append(os.path.join(os.path.expanduser("~"), ".pg_service.conf"))
+    if os.environ.get("PGSYSCONFDIR"):
+        files.append(os.path.join(os.environ["PGSYSCONFDIR"], "pg_service.conf"))
+    return files
+
+
+def read_postgre_sql_service(service_name):
+    """Returns parameters of the given service from the connection service file, see
+    https://www.postgresql.org/docs/current/libpq-pgservice.html"""
+    for service_file in get_postgre_sql_service_files():
+        if not os.path.exists(service_file):
+            continue
+        service_config = configparser.ConfigParser(interpolation=None, delimiters=("=",), comment_prefixes=("#",))
+        service_config.optionxform = str
+        service_config.read(service_file, encoding="utf-8")
+        if service_config.has_section(service_name):
+            return dict(service_config.items(service_name))
+
+    raise ValueError("Definition of service {!r} is not found".format(service_name))
+
+
 def get_app_directory():
     """Determine if application is a script file or exe."""
     if getattr(sys, 'frozen', False):
@@ -94,18 +236,19 @@ def get_app_directory():
 
 
 def load_config_ini():
-    """Read settings from config.ini."""
+    """Read settings from config.ini. Returns False if the file is absent or cannot be parsed."""
     res = False
     config = configparser.ConfigParser()
+    application_path = get_app_directory()
+    config_name = 'config.ini'
+    config_ini_file_path = os.path.join(application_path, config_name)
+    print(f"Path to config file = {config_ini_file_path}")
     try:
-        application_path = get_app_directory()
-        config_name = 'config.ini'
-        config_ini_file_path = os.path.join(application_path, config_name)
-        print(f"Path to config file = {config_ini_file_path}")
-        config.read(config_ini_file_path, encoding="utf-8")
-        res = True
+        if config.read(config_ini_file_path, encoding="utf-8"):
+            res = True
+        else:
+            print(f"Config file {config_ini_file_path} does not exist or cannot be read.", file=sys.stderr)
     except Exception as ex:
-        logging.getLogger("logger").exception(f"Cannot read %s config file: {ex}", config_ini_file_path)
-        time.sleep(5)
+        print(f"Cannot read {config_ini_file_path} config file: {ex}", file=sys.stderr)
 
     return res, config
@@ -6,7 +6,9 @@ import win32service
 import win32serviceutil
 from utils import shell
 from utils import logger
+from utils import journal
 from monitor.cluster_monitor import DbClusterMonitor
+from monitor import config_validation
 
 
 class PgClusterMonitorWindowsService(win32serviceutil.ServiceFramework):
@@ -20,7 +22,6 @@ class PgClusterMonitorWindowsService(win32serviceutil.ServiceFramework):
         self.hWaitStop = win32event.CreateEvent(None, 0, 0, None)
         socket.setdefaulttimeout(60)
 
-        logger.init_logging()
         self.app = None
 
     @classmethod
@@ -43,10 +44,14 @@ class PgClusterMonitorWindowsService(win32serviceutil.ServiceFramework):
         self.main()
 
     def main(self):
-        config_loaded = False
-        config = {}
-        while not config_loaded:
-            config_loaded, config = shell.load_config_ini()
+        config_loaded, config = shell.load_config_ini()
+        config_errors = config_validation.validate_config(config) if config_loaded else ["config.ini cannot be read."]
+        if config_errors:
+            servicemanager.LogErrorMsg("Invalid config: " + " ".join(config_errors))
+            return
+
+        logger.init_logging(config)
+        journal.init_journal(config)
         self.app = DbClusterMonitor(config)
 
         self.app.start()